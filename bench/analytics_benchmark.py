@@ -0,0 +1,58 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Benchmark of the per-reviewer statistics over years of synthetic reviews
+#
+# Usage: python bench/analytics_benchmark.py [--reviews 10000 100000 1000000]
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from analytics import VOTES, ReviewColumns, numpy_aggregations_of, numpy_or_none, python_aggregations_of
+
+YEAR = 365 * 24 * 3600
+
+
+def synthetic_columns(reviews, reviewers=200, projects=50):
+    """Returns the columns of `reviews` reviews spread over three years, a tenth of them of revisions of unknown upload time
+    """
+    randomness = random.Random(reviews)
+    columns = ReviewColumns()
+    for i in range(reviews):
+        reviewer = randomness.randrange(reviewers)
+        timestamp = 1.4e9 + randomness.random() * 3 * YEAR
+        columns.append("reviewer{0}@example.com".format(reviewer), "Reviewer {0}".format(reviewer), "project{0}".format(randomness.randrange(projects)),
+                       randomness.choice(VOTES), timestamp, timestamp - randomness.random() * 86400 if i % 10 else None)
+    return columns
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Times the per-reviewer statistics with NumPy, if installed, and in plain Python')
+    arg_parser.add_argument('--reviews', type=int, nargs='+', default=[10000, 100000, 1000000], metavar='N', help='numbers of reviews')
+    args = arg_parser.parse_args()
+
+    print("{0:>10} {1:>12} {2:>12}".format("reviews", "numpy (s)", "python (s)"))
+    for reviews in args.reviews:
+        columns = synthetic_columns(reviews)
+
+        numpy_seconds = None
+        if numpy_or_none() is not None:
+            start = time.time()
+            numpy_aggregations_of(columns)
+            numpy_seconds = time.time() - start
+
+        start = time.time()
+        python_aggregations_of(columns)
+        python_seconds = time.time() - start
+
+        print("{0:>10} {1:>12} {2:>12.3f}".format(reviews, "{0:.3f}".format(numpy_seconds) if numpy_seconds is not None else "-", python_seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# End-to-end benchmark of redminer.py against local stand-ins of Gerrit and Redmine
+#
+# Usage: python bench/e2e_benchmark.py [--sizes 10 100 1000] [--latency SECONDS] [-- redminer options]
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from standin import StandInGerrit, StandInRedmine, input_page
+
+REDMINER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'redminer.py')
+CHANGES_PER_REPORT = 10
+
+
+def run_redminer(number_of_changes, revisions, messages, latency, redminer_args):
+    """Runs redminer.py over `number_of_changes` changes and returns its measurements
+    """
+    reports = [("Report {0}".format(i), range(i * CHANGES_PER_REPORT, min((i + 1) * CHANGES_PER_REPORT, number_of_changes)))
+               for i in range((number_of_changes + CHANGES_PER_REPORT - 1) // CHANGES_PER_REPORT)]
+    gerrit = StandInGerrit(revisions, messages, latency).start()
+    redmine = StandInRedmine('myproject', {'Code Reviews': input_page(reports)}, latency).start()
+
+    env = dict(os.environ, GERRIT_ADDRESS=gerrit.address, REDMINE_ADDRESS=redmine.address, REDMINE_KEY='key',
+               REDMINE_PROJECT='myproject', REDMINE_INPUT_PAGE='Code Reviews', EMAILS_TO_SKIP='')
+    try:
+        with open(os.devnull, 'w') as devnull:
+            start = time.time()
+            process = subprocess.Popen([sys.executable, REDMINER] + redminer_args, env=env, stdout=devnull)
+            _, status, rusage = os.wait4(process.pid, 0)
+            elapsed = time.time() - start
+    finally:
+        gerrit.stop()
+        redmine.stop()
+
+    if status != 0:
+        raise RuntimeError("redminer.py exited with status {0}".format(status))
+    if len(redmine.updated_pages) != len(reports) and '--dry-run' not in redminer_args and '-n' not in redminer_args:
+        raise RuntimeError("redminer.py updated {0} of {1} reports".format(len(redmine.updated_pages), len(reports)))
+
+    return {
+        "gerrit_requests": gerrit.requests,
+        "redmine_requests": redmine.requests,
+        "seconds": elapsed,
+        "peak_memory_kb": rusage.ru_maxrss,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Runs redminer.py against local stand-ins of Gerrit and Redmine')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='numbers of changes to run with')
+    arg_parser.add_argument('--revisions', type=int, default=10, help='patch sets of each change')
+    arg_parser.add_argument('--messages', type=int, default=50, help='messages of each change')
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='seconds added to each response')
+    arg_parser.add_argument('redminer_args', nargs='*', help='options passed to redminer.py, after --')
+    args = arg_parser.parse_args()
+
+    print("{0:>8} {1:>8} {2:>8} {3:>10} {4:>13} {5:>15}".format(
+        "changes", "gerrit", "redmine", "run (s)", "requests/s", "peak mem (KB)"))
+    for size in args.sizes:
+        result = run_redminer(size, args.revisions, args.messages, args.latency, args.redminer_args)
+        requests = result["gerrit_requests"] + result["redmine_requests"]
+        print("{0:>8} {1:>8} {2:>8} {3:>10.2f} {4:>13.1f} {5:>15}".format(
+            size, result["gerrit_requests"], result["redmine_requests"], result["seconds"],
+            requests / result["seconds"], result["peak_memory_kb"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Benchmark of parsing large input pages, with thousands of rows over several tables
+#
+# Usage: python bench/input_benchmark.py [--rows 1000 10000 50000] [--tables 10]
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from inputparser import ParsedInputPage
+
+TABLE_HEADER = u"table{border:1px bordercolor:darkblue}.\r\n" \
+               u"|_{background:#ffa}.Wiki page|_{background:#ffa}.Sprint|_{background:#ffa}.From (YYYY-MM-DD)|" \
+               u"_{background:#ffa}.Until (YYYY-MM-DD)|_{background:#ffa}.Should be updated (yes/no)|" \
+               u"_{background:#ffa}.Review numbers (space separated list)|_{background:#ffa}.Refresh (minutes)|"
+
+
+def synthetic_input_page(rows, tables):
+    """Returns the text of an input page with `rows` rows spread over `tables` tables, with CRLF line endings
+    """
+    lines = [u"h1. Code Reviews", u""]
+    for table in range(tables):
+        lines.extend([u"h2. Team {0}".format(table), u"", TABLE_HEADER])
+        for row in range(table * rows // tables, (table + 1) * rows // tables):
+            review_numbers = u' '.join(str(100000 + row * 7 + i) for i in range(row % 20))
+            lines.append(u"| [[US{0} - Code reviews of team {1}]] | #{2} | 2014-04-28 | 2014-05-18 | yes | {3} | {4} |".format(
+                row, table, row % 30, review_numbers, row % 60 or u''))
+        lines.append(u"")
+    return u'\r\n'.join(lines)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Times parsing input pages with many rows')
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 50000], metavar='N', help='numbers of rows')
+    arg_parser.add_argument('--tables', type=int, default=10, metavar='N', help='number of tables the rows are spread over')
+    args = arg_parser.parse_args()
+
+    print("{0:>8} {1:>8} {2:>10} {3:>12}".format("rows", "tables", "KB", "parse (s)"))
+    for rows in args.rows:
+        text = synthetic_input_page(rows, args.tables)
+        start = time.time()
+        parsed_input_page = ParsedInputPage(text)
+        seconds = time.time() - start
+        assert len(parsed_input_page.report_items) == rows
+        print("{0:>8} {1:>8} {2:>10} {3:>12.3f}".format(rows, args.tables, len(text) // 1024, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Benchmark of decoding multi-MB change responses whole versus streamed with a projection
+#
+# Usage: python bench/json_benchmark.py [--sizes 1 5 20]
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from gerriter import Gerrit
+from jsonstream import decode_projected
+from parser_benchmark import synthetic_change
+
+CHUNK_SIZE = 64 * 1024
+BYTES_PER_MESSAGE = 700
+
+
+def gerrit_like_change(number, megabytes):
+    """Returns the JSON of a change of about `megabytes` MB, with the fields Gerrit sends but ChangeParser does not use
+    """
+    change = synthetic_change(number, 40, megabytes * 1024 * 1024 // BYTES_PER_MESSAGE)
+    for i, message in enumerate(change["messages"]):
+        message["id"] = "{0:040x}".format(i)
+        message["tag"] = "autogenerated:gerrit:newPatchSet"
+        message["author"]["_account_id"] = 1000 + i % 40
+        message["author"]["avatars"] = [{"url": "https://www.gravatar.com/avatar/{0:032x}.jpg?d=identicon&r=pg&s=26".format(i % 40), "height": 26}]
+        message["real_author"] = message["author"]
+    for revision_id, revision in change["revisions"].items():
+        revision.update({"kind": "REWORK", "created": "2014-05-01 10:00:00.000000000", "uploader": {"_account_id": 1000},
+                         "ref": "refs/changes/{0:02d}/{1}/{2}".format(number % 100, number, revision["_number"]),
+                         "fetch": {"anonymous http": {"url": "https://review.openstack.org/openstack/synthetic", "ref": "refs/changes/1"}}})
+    return change
+
+
+def decode(path, mode):
+    """Decodes the response saved at `path`, as Gerrit's client would, and returns the decoded change
+    """
+    with open(path) as response:
+        if mode == 'whole':
+            return json.loads(response.read().partition("'")[2])
+        chunks = iter(lambda: response.read(CHUNK_SIZE), '')
+        return decode_projected(chunks, Gerrit.CHANGE_PROJECTION, Gerrit.XSSI_PREFIX)
+
+
+def measure(path, mode):
+    """Decodes in a child process and returns its decoding time and the growth of its peak memory in KB
+    """
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--measure', mode, path])
+    seconds, peak_growth_kb = output.split()
+    return float(seconds), int(peak_growth_kb)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Compares decoding large change responses whole and streamed with a projection')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 20], metavar='MB', help='sizes of the responses')
+    arg_parser.add_argument('--measure', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.measure:
+        mode, path = args.measure
+        baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        decode(path, mode)
+        print(time.time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb)
+        return
+
+    print("{0:>10} {1:>10} {2:>12} {3:>14} {4:>12} {5:>14}".format(
+        "size (MB)", "messages", "whole (s)", "whole (KB)", "stream (s)", "stream (KB)"))
+    for size in args.sizes:
+        change = gerrit_like_change(1, size)
+        handle, path = tempfile.mkstemp(suffix='.json')
+        try:
+            with os.fdopen(handle, 'w') as response:
+                response.write(Gerrit.XSSI_PREFIX + json.dumps(change))
+            del change
+            megabytes = os.path.getsize(path) / 1024.0 / 1024.0
+
+            assert decode(path, 'stream')["messages"][0]["message"] == decode(path, 'whole')["messages"][0]["message"]
+            whole_seconds, whole_kb = measure(path, 'whole')
+            stream_seconds, stream_kb = measure(path, 'stream')
+        finally:
+            os.remove(path)
+
+        print("{0:>10.1f} {1:>10} {2:>12.3f} {3:>14} {4:>12.3f} {5:>14}".format(
+            megabytes, size * 1024 * 1024 // BYTES_PER_MESSAGE, whole_seconds, whole_kb, stream_seconds, stream_kb))
+
+
+if __name__ == '__main__':
+    main()
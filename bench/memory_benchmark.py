@@ -0,0 +1,64 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Memory benchmark of the domain model built by ChangeParser, against the model it replaced
+#
+# Usage: python bench/memory_benchmark.py
+
+from __future__ import print_function
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from gerriter import ChangeParser
+from parser_benchmark import baseline_change_from_json, synthetic_change
+
+
+def deep_size(root):
+    """Sums sys.getsizeof of every object reachable from `root`, counting shared ones once
+    """
+    seen = set()
+    to_visit = [root]
+    total = 0
+    while to_visit:
+        obj = to_visit.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            to_visit.extend(obj.keys())
+            to_visit.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            to_visit.extend(obj)
+        else:
+            if hasattr(obj, '__dict__'):
+                to_visit.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for slot in getattr(cls, '__slots__', ()):
+                    if hasattr(obj, slot):
+                        to_visit.append(getattr(obj, slot))
+    return total
+
+
+def main():
+    change_parser = ChangeParser()
+
+    # The model before is made of objects with a __dict__, with an author object per message
+    print("{0:>8} {1:>9} {2:>16} {3:>14} {4:>19} {5:>16}".format(
+        "changes", "reviews", "before (bytes)", "model (bytes)", "before per review", "bytes per review"))
+    for number_of_changes in [10, 100, 1000]:
+        changes_json = [synthetic_change(n, 20, 200) for n in range(number_of_changes)]
+        baseline_size = deep_size([baseline_change_from_json(change_json) for change_json in changes_json])
+        changes = [change_parser.change_from_json(change_json) for change_json in changes_json]
+        reviews = sum(len(revision.reviews) for change in changes for revision in change.revisions)
+        model_size = deep_size(changes)
+
+        print("{0:>8} {1:>9} {2:>16} {3:>14} {4:>19.1f} {5:>16.1f}".format(
+            number_of_changes, reviews, baseline_size, model_size, float(baseline_size) / reviews, float(model_size) / reviews))
+
+
+if __name__ == '__main__':
+    main()
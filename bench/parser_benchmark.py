@@ -0,0 +1,149 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Micro-benchmark of ChangeParser on synthetic large changes, against the parsing it replaced
+#
+# Usage: python bench/parser_benchmark.py
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from gerriter import ChangeParser
+
+
+def synthetic_change(number, revisions, messages, email_domain="example.com"):
+    """Returns the JSON of a change with `messages` spread over `revisions` patch sets
+
+    Even numbered changes are merged, the others are still open.
+    """
+    change_messages = []
+    for i in range(messages):
+        revision_number = i * revisions // messages + 1
+        if i % 3 == 0:
+            text = "Patch Set {0}: Code-Review+1\n\nLooks good to me, just a nit on line {1}.".format(revision_number, i)
+        elif i % 3 == 1:
+            text = "Patch Set {0}:\n\n({1} comments)".format(revision_number, i % 7 + 1)
+        else:
+            text = "Uploaded patch set {0}.".format(revision_number)
+        change_messages.append({
+            "_revision_number": revision_number,
+            "author": {"username": "user{0}".format(i % 40), "name": "User {0}".format(i % 40), "email": "user{0}@{1}".format(i % 40, email_domain)},
+            "date": "2014-05-{0:02d} 10:{1:02d}:{2:02d}.000000000".format(i % 28 + 1, i % 60, i * 7 % 60),
+            "message": text,
+        })
+
+    return {
+        "_number": number,
+        "change_id": "I{0:040x}".format(number),
+        "subject": "Synthetic change {0}".format(number),
+        "project": "openstack/synthetic",
+        "status": "MERGED" if number % 2 == 0 else "NEW",
+        "updated": "2014-05-28 12:00:00.000000000",
+        "revisions": dict(("{0:040x}".format(r), {"_number": r}) for r in range(1, revisions + 1)),
+        "messages": change_messages,
+    }
+
+
+# The parsing of changes before it grouped the messages by revision: every message is
+# scanned again for each revision, and the patterns and timestamps are parsed each time
+
+class BaselineChange:
+    def __init__(self, number, id, subject, project):
+        self.number = number
+        self.id = id
+        self.subject = subject
+        self.project = project
+        self.revisions = []
+
+class BaselineRevision:
+    def __init__(self, id, number):
+        self.id = id
+        self.number = number
+        self.reviews = []
+
+class BaselineReview:
+    def __init__(self, value, author, message, timestamp):
+        self.value = value
+        self.author = author
+        self.message = message
+        self.timestamp = timestamp
+
+    def message_without_vote(self):
+        message_text = self.message.strip()
+        matches_with_vote = re.match("^Patch Set [0-9]+: Code-Review([+-][12])($|\n\n.*)", message_text)
+        matches_without_vote = re.match("^Patch Set [0-9]+:( |\n)+(.*)", message_text)
+        if matches_with_vote is not None and matches_with_vote.group(2) is not None:
+            return matches_with_vote.group(2).strip()
+        elif matches_without_vote is not None and matches_without_vote.group(2) is not None:
+            return matches_without_vote.group(2).strip()
+        return message_text.strip()
+
+class BaselineAuthor:
+    def __init__(self, username, name, email):
+        self.username = username
+        self.name = name
+        self.email = email
+
+def baseline_change_from_json(change):
+    ch = BaselineChange(change["_number"], change["change_id"], change["subject"], change["project"])
+    for revision_id in change["revisions"].keys():
+        r = BaselineRevision(revision_id, change["revisions"][revision_id]["_number"])
+        for message in [m for m in change["messages"] if m["_revision_number"] == r.number]:
+            if message.get("author") is None:
+                continue
+            message_author = message["author"]
+            author = BaselineAuthor(message_author.get("username", ""), message_author["name"], message_author.get("email", ""))
+            message_text = message["message"]
+            timestamp = datetime.strptime(message["date"].rpartition('.')[0] + " UTC", "%Y-%m-%d %H:%M:%S %Z")
+            matches = re.match("^Patch Set [0-9]+: Code-Review([+-][12])($|\n\n)", message_text)
+            value = int(matches.group(1)) if matches is not None else 0
+            r.reviews.append(BaselineReview(value, author, message_text, timestamp))
+        ch.revisions.append(r)
+    return ch
+
+
+def best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def all_reviews(change):
+    return [review for revision in change.revisions for review in revision.reviews]
+
+
+def main():
+    change_parser = ChangeParser()
+
+    print("{0:>9} {1:>9} {2:>15} {3:>12} {4:>15} {5:>16} {6:>16}".format(
+        "revisions", "messages", "old parse (ms)", "parse (ms)", "old strip (ms)", "1st strip (ms)", "2nd strip (ms)"))
+    for revisions, messages in [(5, 50), (20, 200), (40, 500), (80, 2000)]:
+        change_json = synthetic_change(1, revisions, messages)
+
+        baseline_parse_time = best_of(5, lambda: baseline_change_from_json(change_json))
+        parse_time = best_of(5, lambda: change_parser.change_from_json(change_json))
+
+        baseline_reviews = all_reviews(baseline_change_from_json(change_json))
+        baseline_strip_time = best_of(1, lambda: [r.message_without_vote() for r in baseline_reviews])
+
+        reviews = all_reviews(change_parser.change_from_json(change_json))
+        first_strip_time = best_of(1, lambda: [r.message_without_vote() for r in reviews])
+        second_strip_time = best_of(1, lambda: [r.message_without_vote() for r in reviews])
+
+        print("{0:>9} {1:>9} {2:>15.2f} {3:>12.2f} {4:>15.2f} {5:>16.2f} {6:>16.2f}".format(
+            revisions, messages, baseline_parse_time * 1000, parse_time * 1000, baseline_strip_time * 1000, first_strip_time * 1000,
+            second_strip_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
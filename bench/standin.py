@@ -0,0 +1,204 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Local stand-ins of the Gerrit and Redmine servers, serving synthetic data
+#
+# Usage: python bench/standin.py [--changes N] [--revisions N] [--messages N] [--latency SECONDS]
+
+from __future__ import print_function
+
+import argparse
+import gzip
+import json
+import re
+import threading
+import time
+import urllib
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+
+from parser_benchmark import synthetic_change
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StandInServer:
+    """Serves HTTP/1.1 on a random local port from a background thread, counting requests
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.requests = 0
+        self.__lock = threading.Lock()
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                stand_in.handle(self, 'GET')
+
+            def do_PUT(self):
+                stand_in.handle(self, 'PUT')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.address = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, handler, method):
+        with self.__lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse.urlsplit(handler.path)
+        status, body = self.respond(method, urllib.unquote(url.path), urlparse.parse_qs(url.query), handler)
+
+        handler.send_response(status)
+        if body and 'gzip' in handler.headers.get('Accept-Encoding', ''):
+            compressed = StringIO()
+            with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+                f.write(body)
+            body = compressed.getvalue()
+            handler.send_header('Content-Encoding', 'gzip')
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def respond(self, method, path, query, handler):
+        raise NotImplementedError()
+
+
+class StandInGerrit(StandInServer):
+    """Serves the /changes/ endpoints used by gerriter, with Gerrit's )]}' prefix.
+
+    Every change number exists and has `revisions` patch sets and `messages` messages.
+    """
+
+    XSSI_PREFIX = ")]}'\n"
+    PAGE_SIZE = 500
+
+    def __init__(self, revisions=10, messages=50, latency=0):
+        StandInServer.__init__(self, latency)
+        self.revisions = revisions
+        self.messages = messages
+
+    def change(self, number):
+        return synthetic_change(number, self.revisions, self.messages, email_domain="lsd.ufcg.edu.br")
+
+    def summary(self, number):
+        change = self.change(number)
+        return dict((k, v) for k, v in change.items() if k not in ("revisions", "messages"))
+
+    def respond(self, method, path, query, handler):
+        if path == '/changes/':
+            return 200, self.XSSI_PREFIX + json.dumps(self.__query(query))
+
+        matches = re.match('^/changes/([0-9]+)(/detail)?$', path)
+        if matches is None:
+            return 404, ''
+        number = int(matches.group(1))
+        change = self.change(number) if matches.group(2) else self.summary(number)
+        return 200, self.XSSI_PREFIX + json.dumps(change)
+
+    def __query(self, query):
+        query_text = query.get('q', [''])[0]
+        numbers = [int(n) for n in re.findall('change:([0-9]+)', query_text)]
+        after = re.search('after:"([^"]*?)( [+-][0-9]{4})?"', query_text)
+
+        describe = self.change if query.get('o') else self.summary
+        changes = [describe(n) for n in numbers]
+        if after is not None:
+            changes = [c for c in changes if c["updated"] > after.group(1)]
+
+        start = int(query.get('S', ['0'])[0])
+        page = changes[start:start + self.PAGE_SIZE]
+        if start + self.PAGE_SIZE < len(changes):
+            page[-1]["_more_changes"] = True
+        return page
+
+
+class StandInRedmine(StandInServer):
+    """Serves the wiki API of one Redmine project, as used by python-redmine
+    """
+
+    PROJECT_ID = 1
+
+    def __init__(self, project_name, pages, latency=0):
+        StandInServer.__init__(self, latency)
+        self.project_name = project_name
+        self.pages = dict(pages)
+        self.updated_pages = []
+
+    def respond(self, method, path, query, handler):
+        if method == 'GET' and path == '/projects/{0}.json'.format(self.project_name):
+            return 200, json.dumps({"project": {"id": self.PROJECT_ID, "name": self.project_name, "identifier": self.project_name}})
+
+        matches = re.match('^/projects/{0}/wiki/(.*)\\.json$'.format(self.PROJECT_ID), path)
+        if matches is None:
+            return 404, ''
+        title = matches.group(1).decode('utf-8')
+
+        if method == 'PUT':
+            wiki_page = json.loads(handler.rfile.read(int(handler.headers['Content-Length'])))["wiki_page"]
+            self.pages[title] = wiki_page["text"]
+            self.updated_pages.append(title)
+            return 200, ''
+
+        if title not in self.pages:
+            return 404, ''
+        return 200, json.dumps({"wiki_page": {"title": title, "text": self.pages[title], "version": 1}})
+
+
+def input_page(report_titles_and_review_numbers):
+    """Returns the text of an input page listing the reports, all to be updated
+    """
+    header = "|_{background:#ffa}.Wiki page|_{background:#ffa}.Sprint|_{background:#ffa}.From (YYYY-MM-DD)|" \
+             "_{background:#ffa}.Until (YYYY-MM-DD)|_{background:#ffa}.Should be updated (yes/no)|" \
+             "_{background:#ffa}.Review numbers (space separated list)|"
+    rows = ["| [[{0}]] | #{1} | | | yes | {2} |".format(title, i + 1, ' '.join(str(n) for n in review_numbers))
+            for i, (title, review_numbers) in enumerate(report_titles_and_review_numbers)]
+    return "h1. Code Reviews\r\n\r\ntable{border:1px bordercolor:darkblue}.\r\n" + header + "\r\n" + "\r\n".join(rows) + "\r\n"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Serves stand-ins of Gerrit and Redmine until interrupted')
+    arg_parser.add_argument('--changes', type=int, default=100, help='number of changes listed on the input page')
+    arg_parser.add_argument('--revisions', type=int, default=10, help='patch sets of each change')
+    arg_parser.add_argument('--messages', type=int, default=50, help='messages of each change')
+    arg_parser.add_argument('--latency', type=float, default=0, help='seconds added to each response')
+    args = arg_parser.parse_args()
+
+    reports = [("Report {0}".format(i), range(i * 10, min(i * 10 + 10, args.changes))) for i in range((args.changes + 9) // 10)]
+    gerrit = StandInGerrit(args.revisions, args.messages, args.latency).start()
+    redmine = StandInRedmine('myproject', {'Code Reviews': input_page(reports)}, args.latency).start()
+
+    print("export GERRIT_ADDRESS={0}".format(gerrit.address))
+    print("export REDMINE_ADDRESS={0} REDMINE_PROJECT=myproject REDMINE_INPUT_PAGE='Code Reviews' REDMINE_KEY=key".format(redmine.address))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        gerrit.stop()
+        redmine.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Benchmark of the startup time of redminer.py and of importing its modules, each in a new interpreter
+#
+# Usage: python bench/startup_benchmark.py [--runs 20]
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+MODULES = ['inputparser', 'gerriter', 'httpsession', 'reviewstore', 'analytics', 'redminer']
+
+
+def median_milliseconds(command, runs, env):
+    """Runs the command `runs` times and returns the median of its wall-clock times in milliseconds
+    """
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call(command, stdout=devnull, env=env)
+            times.append(1000 * (time.time() - start))
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Times starting redminer.py and importing its modules')
+    arg_parser.add_argument('--runs', type=int, default=20, metavar='N', help='runs of each measure, the median being reported')
+    args = arg_parser.parse_args()
+
+    # Compiled modules, as in the runs after the first one
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    subprocess.check_call([sys.executable, '-m', 'compileall', '-q', SRC_DIR])
+
+    interpreter = median_milliseconds([sys.executable, '-c', 'pass'], args.runs, env)
+    print("{0:<28} {1:>10} {2:>14}".format("", "ms", "ms over python"))
+    print("{0:<28} {1:>10.1f} {2:>14}".format("python -c pass", interpreter, "-"))
+    for module in MODULES:
+        milliseconds = median_milliseconds([sys.executable, '-c', 'import ' + module], args.runs, env)
+        print("{0:<28} {1:>10.1f} {2:>14.1f}".format("import " + module, milliseconds, milliseconds - interpreter))
+    milliseconds = median_milliseconds([sys.executable, os.path.join(SRC_DIR, 'redminer.py'), '--help'], args.runs, env)
+    print("{0:<28} {1:>10.1f} {2:>14.1f}".format("redminer.py --help", milliseconds, milliseconds - interpreter))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Per-reviewer statistics of the reviews of a report, computed over columns of their fields
+
+from __future__ import print_function
+
+import calendar
+from array import array
+
+# NumPy takes longer to import than the rest of gerrit-bot, so it is only imported on first use
+numpy = None
+is_numpy_imported = False
+
+def numpy_or_none():
+    """Returns the numpy module, or None if it is not installed, the statistics being then computed in plain Python
+    """
+    global numpy, is_numpy_imported
+    if not is_numpy_imported:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        is_numpy_imported = True
+    return numpy
+
+
+VOTES = (-2, -1, 0, 1, 2)
+
+UNKNOWN_TIME = float('nan')
+
+def seconds_since_epoch(timestamp):
+    """Seconds since the epoch of a naive UTC datetime, None for None
+    """
+    return calendar.timegm(timestamp.utctimetuple()) if timestamp is not None else None
+
+
+class ReviewColumns:
+    """The reviews of a report flattened into one typed array per field.
+
+    Reviewers, identified by their email, and projects are stored as ids, indexes of
+    `reviewer_names` and `projects`. Times are seconds since the epoch, UNKNOWN_TIME
+    for the revisions whose upload time is not known.
+    """
+
+    def __init__(self):
+        self.reviewer_names = []
+        self.projects = []
+        self.reviewer_ids = array('i')
+        self.project_ids = array('i')
+        self.votes = array('b')
+        self.timestamps = array('d')
+        self.revision_created = array('d')
+        self.__reviewer_ids_by_email = {}
+        self.__project_ids_by_name = {}
+
+    def append(self, author_email, author_name, project, vote, timestamp, revision_created):
+        reviewer_id = self.__reviewer_ids_by_email.get(author_email)
+        if reviewer_id is None:
+            reviewer_id = self.__reviewer_ids_by_email[author_email] = len(self.reviewer_names)
+            self.reviewer_names.append(author_name)
+        project_id = self.__project_ids_by_name.get(project)
+        if project_id is None:
+            project_id = self.__project_ids_by_name[project] = len(self.projects)
+            self.projects.append(project)
+
+        self.reviewer_ids.append(reviewer_id)
+        self.project_ids.append(project_id)
+        self.votes.append(vote)
+        self.timestamps.append(timestamp)
+        self.revision_created.append(revision_created if revision_created is not None else UNKNOWN_TIME)
+
+    def __len__(self):
+        return len(self.votes)
+
+
+class ReviewerStatistics(object):
+    """The number of reviews of a reviewer, of each vote of VOTES, of each project, and
+    the median time from the upload of a revision to its review, in seconds, or None
+    """
+    __slots__ = ('name', 'reviews', 'votes', 'median_time_to_review', 'reviews_by_project')
+
+    def __init__(self, name, reviews, votes, median_time_to_review, reviews_by_project):
+        self.name = name
+        self.reviews = reviews
+        self.votes = votes
+        self.median_time_to_review = median_time_to_review
+        self.reviews_by_project = reviews_by_project
+
+
+def reviewer_statistics_of(columns):
+    """Returns the ReviewerStatistics of each reviewer of the columns, the ones with the most reviews first
+
+    The aggregations are vectorized with NumPy if it is installed.
+    """
+    if len(columns) == 0:
+        return []
+    if numpy_or_none() is not None:
+        reviews, votes, medians, reviews_by_project = numpy_aggregations_of(columns)
+    else:
+        reviews, votes, medians, reviews_by_project = python_aggregations_of(columns)
+
+    statistics = []
+    for reviewer_id, name in enumerate(columns.reviewer_names):
+        projects = sorted(((project, count) for project, count in zip(columns.projects, reviews_by_project[reviewer_id]) if count),
+                          key=lambda project_and_count: (-project_and_count[1], project_and_count[0]))
+        statistics.append(ReviewerStatistics(name, reviews[reviewer_id], votes[reviewer_id], medians[reviewer_id], projects))
+    statistics.sort(key=lambda s: (-s.reviews, s.name))
+    return statistics
+
+def numpy_aggregations_of(columns):
+    reviewer_count = len(columns.reviewer_names)
+    project_count = len(columns.projects)
+    reviewer_ids = numpy.frombuffer(columns.reviewer_ids, dtype=numpy.intc).astype(numpy.intp)
+    project_ids = numpy.frombuffer(columns.project_ids, dtype=numpy.intc)
+    votes = numpy.frombuffer(columns.votes, dtype=numpy.int8)
+    times_to_review = numpy.frombuffer(columns.timestamps) - numpy.frombuffer(columns.revision_created)
+
+    reviews = numpy.bincount(reviewer_ids, minlength=reviewer_count)
+    vote_counts = numpy.bincount(reviewer_ids * len(VOTES) + (votes - VOTES[0]), minlength=reviewer_count * len(VOTES))
+    project_counts = numpy.bincount(reviewer_ids * project_count + project_ids, minlength=reviewer_count * project_count)
+
+    # Sorted by reviewer, then time, the known times of each reviewer are a slice whose middle is its median
+    is_known = ~numpy.isnan(times_to_review)
+    known_reviewer_ids = reviewer_ids[is_known]
+    known_times = times_to_review[is_known]
+    order = numpy.lexsort((known_times, known_reviewer_ids))
+    known_times = known_times[order]
+    known_counts = numpy.bincount(known_reviewer_ids, minlength=reviewer_count)
+    starts = numpy.cumsum(known_counts) - known_counts
+    has_known = known_counts > 0
+    lower = numpy.where(has_known, starts + (known_counts - 1) // 2, 0)
+    upper = numpy.where(has_known, starts + known_counts // 2, 0)
+    medians = (known_times[lower] + known_times[upper]) / 2 if len(known_times) else numpy.zeros(reviewer_count)
+
+    return (reviews.tolist(), vote_counts.reshape(reviewer_count, len(VOTES)).tolist(),
+            [float(m) if known else None for m, known in zip(medians, has_known)],
+            project_counts.reshape(reviewer_count, project_count).tolist())
+
+def python_aggregations_of(columns):
+    reviewer_count = len(columns.reviewer_names)
+    project_count = len(columns.projects)
+    reviews = [0] * reviewer_count
+    vote_counts = [[0] * len(VOTES) for _ in range(reviewer_count)]
+    project_counts = [[0] * project_count for _ in range(reviewer_count)]
+    known_times = [[] for _ in range(reviewer_count)]
+
+    for reviewer_id, project_id, vote, timestamp, created in zip(columns.reviewer_ids, columns.project_ids, columns.votes,
+                                                                 columns.timestamps, columns.revision_created):
+        reviews[reviewer_id] += 1
+        vote_counts[reviewer_id][vote - VOTES[0]] += 1
+        project_counts[reviewer_id][project_id] += 1
+        if created == created:  # not NaN
+            known_times[reviewer_id].append(timestamp - created)
+
+    medians = []
+    for times in known_times:
+        times.sort()
+        medians.append((times[(len(times) - 1) // 2] + times[len(times) // 2]) / 2 if times else None)
+    return reviews, vote_counts, medians, project_counts
+
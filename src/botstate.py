@@ -0,0 +1,29 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Persistence of the state kept by gerrit-bot between runs
+
+from __future__ import print_function
+
+import json
+import os
+import tempfile
+
+
+def load_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return default
+
+def save_json(path, value):
+    """Writes to a temporary file and renames it, so readers never see a partial file
+    """
+    directory = os.path.dirname(path) or '.'
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(value, f)
+    os.rename(temp_path, path)
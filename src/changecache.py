@@ -0,0 +1,80 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Persistent on-disk cache of the changes fetched from Gerrit
+
+from __future__ import print_function
+
+import os
+import time
+
+from botstate import load_json, save_json
+
+def debug(msg):
+    pass
+    #print(msg)
+
+
+# Merged changes do not move anymore. Abandoned ones may be restored, and still get reviews
+# meanwhile, so they are checked for updates like the open ones.
+FINAL_STATUSES = ('MERGED',)
+
+def is_final(change_json):
+    return change_json.get("status") in FINAL_STATUSES
+
+
+class ChangeCache:
+    """Stores the JSON of Gerrit changes on disk, one file per change number.
+
+    Each entry keeps Gerrit's "updated" field beside the payload, so callers can tell
+    whether an open change has moved since it was cached. Entries are evicted by
+    least recent use: when there are more than `max_entries` of them, or when they
+    were not used for more than `max_age_days`.
+
+    Changes of other Gerrit hosts are kept in namespaces, subdirectories that share the
+    eviction of their parent.
+    """
+
+    def __init__(self, directory, max_entries=None, max_age_days=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+
+    def get(self, change_number):
+        path = self.__path_of(change_number)
+        entry = load_json(path, None)
+        if entry is None:
+            return None
+
+        os.utime(path, None)  # records the use for eviction
+        debug("[Cache] Hit: " + str(change_number))
+        return entry
+
+    def namespace(self, name):
+        return ChangeCache(os.path.join(self.directory, name), self.max_entries, self.max_age_days)
+
+    def put(self, change_number, change_json):
+        entry = {"updated": change_json.get("updated"), "status": change_json.get("status"), "change": change_json}
+        save_json(self.__path_of(change_number), entry)
+
+    def evict(self):
+        if not os.path.isdir(self.directory):
+            return 0
+
+        paths = [os.path.join(directory, n) for directory, _, names in os.walk(self.directory) for n in names if n.endswith('.json')]
+        paths_by_last_use = sorted(paths, key=os.path.getmtime, reverse=True)
+
+        to_evict = []
+        if self.max_entries is not None:
+            to_evict.extend(paths_by_last_use[self.max_entries:])
+            paths_by_last_use = paths_by_last_use[:self.max_entries]
+        if self.max_age_days is not None:
+            oldest_allowed = time.time() - self.max_age_days * 24 * 60 * 60
+            to_evict.extend(p for p in paths_by_last_use if os.path.getmtime(p) < oldest_allowed)
+
+        for path in to_evict:
+            os.remove(path)
+        debug("[Cache] Evicted {0} entries".format(len(to_evict)))
+        return len(to_evict)
+
+    def __path_of(self, change_number):
+        return os.path.join(self.directory, str(change_number) + '.json')
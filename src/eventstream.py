@@ -0,0 +1,160 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Ingestion of Gerrit stream-events into the parsed changes
+
+from __future__ import print_function
+
+import json
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from Queue import Queue, Empty
+
+from gerriter import Revision
+
+def debug(msg):
+    pass
+    #print(msg)
+
+def info(msg):
+    #pass
+    print(msg)
+
+
+def open_event_source(source):
+    """Opens the source of the events as a file: "-" is the standard input,
+    "tcp:HOST:PORT" and "unix:PATH" are sockets, anything else is a file or a pipe.
+    """
+    if source == '-':
+        return sys.stdin
+    if source.startswith('tcp:'):
+        host, _, port = source[len('tcp:'):].rpartition(':')
+        return socket.create_connection((host, int(port))).makefile('r')
+    if source.startswith('unix:'):
+        unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        unix_socket.connect(source[len('unix:'):])
+        return unix_socket.makefile('r')
+    return open(source)
+
+
+class EventStream:
+    """Reads the JSON lines of `gerrit stream-events` from a source in a background thread
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.events = Queue()
+        self.thread = threading.Thread(target=self.__read)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def is_alive(self):
+        """Whether events may still be read from the source, False once it ended or failed
+        """
+        return self.thread.is_alive()
+
+    def drain(self, timeout):
+        """Waits up to `timeout` seconds for an event and returns it with all the others already read
+        """
+        events = []
+        try:
+            events.append(self.events.get(timeout=timeout))
+            while True:
+                events.append(self.events.get_nowait())
+        except Empty:
+            pass
+        return events
+
+    def __read(self):
+        try:
+            lines = open_event_source(self.source)
+            for line in iter(lines.readline, ''):
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    debug("[Events] Ignoring malformed line: " + line)
+                    continue
+                if isinstance(event, dict):
+                    self.events.put(event)
+            info("[Events] End of the events from " + self.source)
+        except (IOError, socket.error) as e:
+            info("[Events] Failed reading events from {0}: {1}".format(self.source, e))
+
+
+class EventIngester:
+    """Applies Gerrit events to the changes kept in memory by a ChangeParser.
+
+    "patchset-created" adds a revision and "comment-added" adds a review, as if the
+    change had been fetched again. Events of changes that are not known are left for
+    the next fetch of the change. The changes are written again to the parser's
+    review store, if it has one.
+    """
+
+    # Reviews that were already fetched may reach us again as events, with a slightly different time
+    SAME_REVIEW_TOLERANCE = timedelta(seconds=5)
+
+    APPLIED_EVENT_TYPES = ("patchset-created", "comment-added")
+
+    def __init__(self, change_parser):
+        self.change_parser = change_parser
+
+    def apply(self, event):
+        """Returns the number of the change whose reviews the event may have changed, or None
+        """
+        if event.get("type") not in self.APPLIED_EVENT_TYPES:
+            return None
+        if not self.__is_well_formed(event):
+            debug("[Events] Ignoring malformed event: " + repr(event))
+            return None
+        change_number = str(event["change"]["number"])
+
+        known = self.change_parser.known_changes.get(change_number)
+        if known is None:
+            debug("[Events] Change not known yet: " + change_number)
+            return change_number
+        change, updated, status = known
+
+        if event["type"] == "patchset-created":
+            self.__revision_of(change, event["patchSet"])
+        else:
+            self.__add_review(change, event)
+
+        if self.change_parser.review_store is not None:
+            self.change_parser.review_store.put_change(self.change_parser.review_number_of(change), change, updated, status)
+        return change_number
+
+    def __is_well_formed(self, event):
+        change = event.get("change")
+        patch_set = event.get("patchSet")
+        if not isinstance(change, dict) or "number" not in change:
+            return False
+        if not isinstance(patch_set, dict) or "number" not in patch_set or "revision" not in patch_set:
+            return False
+        return event["type"] != "comment-added" or isinstance(event.get("author"), dict)
+
+    def __revision_of(self, change, patch_set):
+        revision_number = int(patch_set["number"])
+        for revision in change.revisions:
+            if revision.number == revision_number:
+                return revision
+
+        created = datetime.utcfromtimestamp(patch_set["createdOn"]) if patch_set.get("createdOn") else None
+        revision = Revision(patch_set["revision"], revision_number, created)
+        change.revisions.append(revision)
+        return revision
+
+    def __add_review(self, change, event):
+        revision = self.__revision_of(change, event["patchSet"])
+        timestamp = datetime.utcfromtimestamp(event.get("eventCreatedOn") or time.time())
+        review = self.change_parser.review_of(event["author"], event.get("comment", ""), timestamp)
+
+        for r in revision.reviews:
+            if r.author is review.author and r.message == review.message and abs(r.timestamp - timestamp) <= self.SAME_REVIEW_TOLERANCE:
+                debug("[Events] Review already known")
+                return
+        revision.reviews.append(review)
@@ -3,11 +3,19 @@
 # Script to fetch and parse changes from Gerrit
 
 from __future__ import print_function
+from collections import OrderedDict
 from datetime import datetime
 
 import json
-import urllib2
 import re
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from changecache import FINAL_STATUSES, is_final
+from httpsession import HttpSession
+from jsonstream import Fields, decode_projected
+from metrics import TimedIterator, metrics
 
 def debug(msg):
     pass
@@ -20,96 +28,264 @@ def info(msg):
 
 # Gerrit
 
+DEFAULT_GERRIT_ADDRESS = "https://review.openstack.org"
+
 class Gerrit:
     """Gerrit interface that returns interpreted JSON collections
+
+    If a ChangeCache is given, merged changes are served from it and the others are
+    only fetched in full again when their "updated" field has moved. Requests go
+    through an HttpSession, which may be shared with other clients.
     """
 
+    # Options of /changes/ queries that return the same fields as /detail?o=all_revisions&o=messages
+    CHANGE_DETAIL_OPTIONS = ('ALL_REVISIONS', 'MESSAGES', 'DETAILED_ACCOUNTS')
+    MAX_CHANGES_PER_QUERY = 50
+    MAX_QUERY_URL_LENGTH = 2000
+
+    # Fields of a change that ChangeParser and the cache use, the only ones decoded from the responses
+    CHANGE_PROJECTION = {
+        "_number": True, "change_id": True, "subject": True, "project": True, "status": True, "updated": True, "_more_changes": True,
+        "revisions": {"*": Fields(["_number", "created"])},
+        "messages": [Fields(["author", "message", "date", "_revision_number"])],
+    }
+
+    # Prefix that Gerrit puts before its JSON responses against XSSI
+    XSSI_PREFIX = ")]}'\n"
+
+    def __init__(self, cache=None, session=None, address=DEFAULT_GERRIT_ADDRESS):
+        self.address = address.rstrip('/')
+        self.cache = cache
+        self.session = session if session is not None else HttpSession()
+
     def fetch_change(self, change_number):
-        url = "https://review.openstack.org/changes/" + str(change_number) + "/detail?o=all_revisions&o=messages"
-        return self.__fetch_json(url)
+        if self.cache is None:
+            return self.__fetch_change_detail(change_number)
+
+        cached = self.cache.get(change_number)
+        if cached is not None:
+            if is_final(cached):
+                debug("[Gerrit] Using cached merged change: " + str(change_number))
+                return cached["change"]
+            if self.fetch_change_summary(change_number).get("updated") == cached["updated"]:
+                debug("[Gerrit] Using cached unchanged change: " + str(change_number))
+                return cached["change"]
+
+        change = self.__fetch_change_detail(change_number)
+        self.cache.put(change_number, change)
+        return change
+
+    def fetch_changes(self, change_numbers):
+        """Fetches many changes with /changes/?q=change:A+OR+change:B... queries.
+
+        Returns a dict from each change number, as a string, to its JSON. Changes not
+        found on Gerrit are left out of it.
+        """
+        change_numbers = [str(cn) for cn in change_numbers]
+        if self.cache is None:
+            return self.__query_changes(change_numbers, self.CHANGE_DETAIL_OPTIONS)
+
+        changes = {}
+        cached_changes_to_check = {}
+        change_numbers_to_fetch = []
+        for change_number in change_numbers:
+            cached = self.cache.get(change_number)
+            if cached is None:
+                change_numbers_to_fetch.append(change_number)
+            elif is_final(cached):
+                debug("[Gerrit] Using cached merged change: " + change_number)
+                changes[change_number] = cached["change"]
+            else:
+                cached_changes_to_check[change_number] = cached
+
+        summaries = self.fetch_change_summaries(cached_changes_to_check.keys())
+        for change_number, cached in cached_changes_to_check.items():
+            if change_number in summaries and summaries[change_number].get("updated") == cached["updated"]:
+                debug("[Gerrit] Using cached unchanged change: " + change_number)
+                changes[change_number] = cached["change"]
+            else:
+                change_numbers_to_fetch.append(change_number)
+
+        fetched_changes = self.__query_changes(change_numbers_to_fetch, self.CHANGE_DETAIL_OPTIONS)
+        for change_number, change in fetched_changes.items():
+            self.cache.put(change_number, change)
+        changes.update(fetched_changes)
+        return changes
+
+    def fetch_change_summaries(self, change_numbers):
+        """Fetches just the fields of many changes that have no query option, like "updated" and "status"
+        """
+        return self.__query_changes([str(cn) for cn in change_numbers])
+
+    def fetch_changes_updated_since(self, change_numbers, since):
+        """Returns a dict from the numbers of the changes updated after `since`, a UTC
+        "YYYY-MM-DD hh:mm:ss" timestamp, to their "updated" field.
+        """
+        import urllib  # only the incremental runs need it, and it is slow to import
+
+        after_since = "+after:" + urllib.quote('"' + since + ' +0000"')
+        summaries = self.__query_changes([str(cn) for cn in change_numbers], (), after_since)
+        return dict((change_number, summary["updated"]) for change_number, summary in summaries.items())
+
+    def fetch_change_summary(self, change_number):
+        url = self.address + "/changes/" + str(change_number)
+        return self.__fetch_json(url, "gerrit summary")
 
     def fetch_revision(self, change_number, revision_id):
-        url = "https://review.openstack.org/changes/" + str(change_number) + "/revisions/" + str(revision_id) + "/review"
-        return self.__fetch_json(url)
-
-    def __fetch_json(self, url):
+        url = self.address + "/changes/" + str(change_number) + "/revisions/" + str(revision_id) + "/review"
+        return self.__fetch_json(url, "gerrit revision")
+
+    def __fetch_change_detail(self, change_number):
+        url = self.address + "/changes/" + str(change_number) + "/detail?o=all_revisions&o=messages"
+        return self.__fetch_json(url, "gerrit change", self.CHANGE_PROJECTION)
+
+    def __query_changes(self, change_numbers, options=(), other_terms=""):
+        changes = {}
+        for query_url in self.__query_urls(change_numbers, options, other_terms):
+            start = 0
+            while True:
+                url = query_url + ("&S=" + str(start) if start else "")
+                page = self.__fetch_json(url, "gerrit query", [self.CHANGE_PROJECTION] if options else None)
+                for change in page:
+                    changes[str(change["_number"])] = change
+                if not page or not page[-1].get("_more_changes"):
+                    break
+                start += len(page)
+        return changes
+
+    def __query_urls(self, change_numbers, options, other_terms=""):
+        """Splits the change numbers into queries short enough to be safe as URLs
+
+        The change numbers are ORed with each other and ANDed with `other_terms`.
+        """
+        base_url = self.address + "/changes/?q="
+        options_text = ''.join("&o=" + o for o in options)
+
+        def query_url(terms):
+            changes_query = "+OR+".join(terms)
+            if other_terms:
+                changes_query = "(" + changes_query + ")" + other_terms
+            return base_url + changes_query + options_text
+
+        query_urls = []
+        terms = []
+        for change_number in change_numbers:
+            term = "change:" + change_number
+            if terms and (len(terms) == self.MAX_CHANGES_PER_QUERY or len(query_url(terms + [term])) > self.MAX_QUERY_URL_LENGTH):
+                query_urls.append(query_url(terms))
+                terms = []
+            terms.append(term)
+        if terms:
+            query_urls.append(query_url(terms))
+        return query_urls
+
+    def __fetch_json(self, url, endpoint, projection=None):
+        """Decodes the response, or with a `projection`, streams it through a ProjectingDecoder
+        """
         info("[Gerrit] Fetching: " + url)
-        response_body = urllib2.urlopen(url).read()
-        sanitized_body = response_body.partition("'")[2]
-        return json.loads(sanitized_body)
+        if projection is not None:
+            # The response is read from the network while it is decoded, the time spent
+            # waiting for its chunks being counted apart from the time spent decoding them
+            chunks = TimedIterator(self.session.get_chunks(url, endpoint))
+            start = time.time()
+            try:
+                return decode_projected(chunks, projection, self.XSSI_PREFIX)
+            finally:
+                metrics.record_phase("gerrit response read", chunks.seconds)
+                metrics.record_phase("json stream decode", time.time() - start - chunks.seconds)
+
+        response_body = self.session.get(url, endpoint)
+        with metrics.phase("json decode"):
+            sanitized_body = response_body.partition("'")[2]
+            return json.loads(sanitized_body)
 
 
 # Domain model
 
-class Change:
-    def __init__(self, number, id, subject, project):
+CODE_REVIEW_VOTE = re.compile("^Patch Set [0-9]+: Code-Review([+-][12])($|\n\n)")
+MESSAGE_WITH_VOTE = re.compile("^Patch Set [0-9]+: Code-Review([+-][12])($|\n\n.*)")
+MESSAGE_WITHOUT_VOTE = re.compile("^Patch Set [0-9]+:( |\n)+(.*)")
+
+def parse_gerrit_timestamp(timestamp_text):
+    """Parses Gerrit's "YYYY-MM-DD hh:mm:ss.nnnnnnnnn" UTC timestamps, dropping the fraction
+
+    Slicing the fixed-width fields is much faster than datetime.strptime.
+    """
+    return datetime(int(timestamp_text[0:4]), int(timestamp_text[5:7]), int(timestamp_text[8:10]),
+                    int(timestamp_text[11:13]), int(timestamp_text[14:16]), int(timestamp_text[17:19]))
+
+class Change(object):
+    __slots__ = ('number', 'id', 'subject', 'project', 'revisions', 'gerrit_address')
+
+    def __init__(self, number, id, subject, project, gerrit_address=DEFAULT_GERRIT_ADDRESS):
         self.number = number
         self.id = id
         self.subject = subject
         self.project = project
         self.revisions = []
+        self.gerrit_address = gerrit_address
 
     def title(self):
         return "Change "+self.id[0:9]+": "+self.subject
 
     def permalink(self):
-        return "https://review.openstack.org/"+str(self.number)
+        return self.gerrit_address+"/"+str(self.number)
 
     def __repr__(self):
         return "Change("+repr(self.number)+", "+repr(self.id)+", "+repr(self.subject)+", "+repr(self.project)+", "+repr(self.revisions)+")"
 
-class Revision:
-    def __init__(self, id, number):
+class Revision(object):
+    __slots__ = ('id', 'number', 'reviews', 'created')
+
+    def __init__(self, id, number, created=None):
         self.id = id
         self.number = number
         self.reviews = []
+        self.created = created
 
     def __repr__(self):
         return "Revision("+repr(self.number)+", "+repr(self.id)+", "+repr(self.reviews)+")"
 
-class Review:
+class Review(object):
+    __slots__ = ('value', 'author', 'message', 'timestamp', '__message_without_vote')
+
     def __init__(self, value, author, message, timestamp):
         self.value = value
         self.author = author
         self.message = message
         self.timestamp = timestamp
+        self.__message_without_vote = None
 
     def vote(self):
         return "{0:+d}".format(self.value) if self.value != 0 else str(0)
 
     def message_without_vote(self):
-        message_text = self.message.strip()
-        message_without_vote = ""
-
-        matches_with_vote = re.match("^Patch Set [0-9]+: Code-Review([+-][12])($|\n\n.*)", message_text)
-        matches_without_vote = re.match("^Patch Set [0-9]+:( |\n)+(.*)", message_text)
+        if self.__message_without_vote is None:
+            self.__message_without_vote = self.__strip_vote(self.message.strip())
+        return self.__message_without_vote
 
+    def __strip_vote(self, message_text):
+        matches_with_vote = MESSAGE_WITH_VOTE.match(message_text)
         if matches_with_vote is not None and matches_with_vote.group(2) is not None:
-            message_without_vote = matches_with_vote.group(2).strip()
             debug("matches with vote")
+            return matches_with_vote.group(2).strip()
 
-        elif matches_without_vote is not None and matches_without_vote.group(2) is not None:
-            message_without_vote = matches_without_vote.group(2).strip()
+        matches_without_vote = MESSAGE_WITHOUT_VOTE.match(message_text)
+        if matches_without_vote is not None and matches_without_vote.group(2) is not None:
             debug("matches without vote")
+            return matches_without_vote.group(2).strip()
 
-        else:
-            message_without_vote = message_text.strip()
-            debug("matches with none")
-
-        return message_without_vote
+        debug("matches with none")
+        return message_text.strip()
 
     def __repr__(self):
         return "Review("+repr(self.vote())+", "+repr(self.author)+", "+repr(self.message)+", "+repr(self.timestamp)+")"
 
-review_with_single_line_message = Review(1, None, '\nPatch Set 9: (1 inline comment)\n', None)
-assert review_with_single_line_message.vote() == '+1'
-assert review_with_single_line_message.message_without_vote() == '(1 inline comment)'
-
-review_with_multi_line_message = Review(0, None, '\nPatch Set 9:\n\n(1 comment)\n', None)
-assert review_with_multi_line_message.vote() == '0'
-assert review_with_multi_line_message.message_without_vote() == '(1 comment)'
+class Author(object):
+    """A reviewer. ChangeParser interns them, so each one exists once however many messages it wrote
+    """
+    __slots__ = ('username', 'name', 'email')
 
-class Author:
     def __init__(self, username, name, email):
         self.username = username
         self.name = name
@@ -122,57 +298,333 @@ class Author:
 # Action
 
 class ChangeParser:
-    def __init__(self):
-        self.gerrit = Gerrit()
+    """Fetches changes from Gerrit and parses them into the domain model.
+
+    With `keep_changes`, the parsed changes are kept in memory, for long-running
+    processes. Merged ones are reused as they are, the others while their "updated"
+    field did not move. If something else keeps them up to date, like a stream of
+    Gerrit events, setting `trust_known_changes` reuses all of them without asking
+    Gerrit.
+
+    With a `review_store`, every parsed change is also written to it, under its review
+    number: "HOST:NUMBER" if the parser is given the `host` it fetches from, as is done
+    for the hosts other than the default one, or else just the change number.
+    """
+
+    def __init__(self, concurrency=1, cache=None, batch_size=1, session=None, gerrit_address=DEFAULT_GERRIT_ADDRESS, keep_changes=False, review_store=None, host=None):
+        self.gerrit = Gerrit(cache, session, gerrit_address)
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.errors = {}
+        self.authors = {}
+        self.known_changes = {} if keep_changes else None
+        self.trust_known_changes = False
+        self.review_store = review_store
+        self.host = host
 
     def change_with_number(self, change_number):
-        change = self.gerrit.fetch_change(change_number)
+        return self.change_from_json(self.gerrit.fetch_change(change_number))
+
+    def change_from_json(self, change):
+        with metrics.phase("model building"):
+            ch = self.__change_from_json(change)
+
+        if self.known_changes is not None:
+            self.known_changes[str(ch.number)] = (ch, change.get("updated"), change.get("status"))
+        if self.review_store is not None:
+            with metrics.phase("review store"):
+                self.review_store.put_change(self.review_number_of(ch), ch, change.get("updated"), change.get("status"))
+        return ch
+
+    def review_number_of(self, change):
+        return self.host + ":" + str(change.number) if self.host else str(change.number)
 
+    def __change_from_json(self, change):
         debug(change["subject"])
-        ch = Change(change["_number"], change["change_id"], change["subject"], change["project"])
+        ch = Change(change["_number"], change["change_id"], change["subject"], change["project"], self.gerrit.address)
 
-        revision_ids = change["revisions"].keys()
-        debug("==========")
-        for revision_id in revision_ids:
-            r = Revision(revision_id, change["revisions"][revision_id]["_number"])
-            debug("Revision: " + str(r.number))
+        # Groups the messages by revision in a single pass, keeping their order
+        messages_by_revision_number = {}
+        for message in change["messages"]:
+            messages_by_revision_number.setdefault(message.get("_revision_number"), []).append(message)
 
-            messages_of_this_revision = [m for m in change["messages"] if m["_revision_number"] == r.number]
-            #debug(messages_of_this_revision)
+        for revision_id, revision in change["revisions"].items():
+            r = Revision(revision_id, revision["_number"], parse_gerrit_timestamp(revision["created"]) if "created" in revision else None)
 
-            for message in messages_of_this_revision:
+            for message in messages_by_revision_number.get(r.number, ()):
                 if message.get("author") is None:
                     continue
-                message_author = message["author"]
-                author = Author(message_author.get("username", ""), message_author["name"], message_author.get("email", ""))
-                debug(message)
-                debug(author)
-
-                message_text = message["message"]
-                timestamp = datetime.strptime(message["date"].rpartition('.')[0]+" UTC", "%Y-%m-%d %H:%M:%S %Z")
-
-                value = 0
-                matches = re.match("^Patch Set [0-9]+: Code-Review([+-][12])($|\n\n)", message_text)
-                if matches is not None:
-                    debug("Vote match: " + matches.group(1))
-                    value = int(matches.group(1))
-                else:
-                    debug("Vote did not match.")
-
-                review = Review(value, author, message_text, timestamp)
-                r.reviews.append(review)
-                debug(review)
-
-            #debug(code_reviews)
-            debug("==========")
+                r.reviews.append(self.review_of(message["author"], message["message"], parse_gerrit_timestamp(message["date"])))
+
             ch.revisions.append(r)
             debug(r)
 
         debug(ch)
         return ch
 
+    def review_of(self, author_json, message_text, timestamp):
+        # Gerrit leaves the name out for the accounts without a full name
+        name = author_json.get("name") or author_json.get("username") or author_json.get("email", "")
+        author = self.__interned_author(author_json.get("username", ""), name, author_json.get("email", ""))
+
+        matches = CODE_REVIEW_VOTE.match(message_text)
+        value = int(matches.group(1)) if matches is not None else 0
+
+        return Review(value, author, message_text, timestamp)
+
+    def __interned_author(self, username, name, email):
+        key = (username, name, email)
+        author = self.authors.get(key)
+        if author is None:
+            author = self.authors.setdefault(key, Author(username, name, email))
+        return author
+
     def changes(self, change_numbers):
-        return [self.change_with_number(cn) for cn in change_numbers]
+        return list(self.changes_by_number(change_numbers).values())
+
+    def changes_updated_since(self, change_numbers, since):
+        return self.gerrit.fetch_changes_updated_since(change_numbers, since)
+
+    def changes_by_number(self, change_numbers):
+        """Fetches and parses the changes with up to `concurrency` requests in flight.
+
+        If `batch_size` is greater than 1, each request fetches that many changes at once.
+
+        Returns an OrderedDict from each of `change_numbers` to its Change, in the same
+        order as `change_numbers`. A change that fails to be fetched or parsed is left
+        out of the result and its exception is recorded in `errors`, keyed by its change
+        number, instead of aborting the others.
+        """
+        change_numbers = list(change_numbers)
+        self.errors = {}
+
+        known_changes = self.__unmoved_known_changes(change_numbers)
+        all_change_numbers = change_numbers
+        change_numbers = [cn for cn in change_numbers if str(cn) not in known_changes]
+
+        if self.batch_size > 1:
+            batches = [change_numbers[i:i + self.batch_size] for i in range(0, len(change_numbers), self.batch_size)]
+            results = [result for batch_results in self.__map(self.__try_changes_with_numbers, batches) for result in batch_results]
+        else:
+            results = self.__map(self.__try_change_with_number, change_numbers)
+
+        results_by_number = dict(zip(change_numbers, results))
+        changes = OrderedDict()
+        for change_number in all_change_numbers:
+            if str(change_number) in known_changes:
+                changes[change_number] = known_changes[str(change_number)]
+                continue
+            change, error = results_by_number[change_number]
+            if error is not None:
+                self.errors[change_number] = error
+            else:
+                changes[change_number] = change
+        return changes
+
+    def forget_changes_other_than(self, change_numbers):
+        """Drops the known changes whose numbers are not among `change_numbers`
+        """
+        if self.known_changes is None:
+            return
+        kept_change_numbers = set(str(cn) for cn in change_numbers)
+        for change_number in list(self.known_changes):
+            if change_number not in kept_change_numbers:
+                del self.known_changes[change_number]
+
+    def __unmoved_known_changes(self, change_numbers):
+        """Returns a dict from the numbers of the known changes that did not move to their Change
+        """
+        if not self.known_changes:
+            return {}
+
+        unmoved_changes = {}
+        known_changes_to_check = {}
+        for change_number in change_numbers:
+            known = self.known_changes.get(str(change_number))
+            if known is None:
+                continue
+            change, updated, status = known
+            if status in FINAL_STATUSES or self.trust_known_changes:
+                unmoved_changes[str(change_number)] = change
+            else:
+                known_changes_to_check[str(change_number)] = (change, updated)
+
+        if known_changes_to_check:
+            try:
+                summaries = self.gerrit.fetch_change_summaries(known_changes_to_check.keys())
+            except Exception as e:
+                info("[Gerrit] Failed revalidating known changes: {0}".format(e))
+                summaries = {}
+            for change_number, (change, updated) in known_changes_to_check.items():
+                if change_number in summaries and summaries[change_number].get("updated") == updated:
+                    unmoved_changes[change_number] = change
+
+        debug("[Gerrit] Reusing {0} known changes".format(len(unmoved_changes)))
+        return unmoved_changes
+
+    def __map(self, function, items):
+        if self.concurrency == 1 or len(items) <= 1:
+            return [function(item) for item in items]
+
+        pool = ThreadPool(min(self.concurrency, len(items)))
+        try:
+            return pool.map(function, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def __try_changes_with_numbers(self, change_numbers):
+        """Each change is timed as the time to fetch its whole batch plus to parse it
+
+        If the batch fails, its changes are fetched one by one, so that only the ones
+        that fail by themselves are recorded as failed.
+        """
+        start = time.time()
+        try:
+            changes_json = self.gerrit.fetch_changes(change_numbers)
+        except Exception as e:
+            info("[Gerrit] Failed fetching changes {0}: {1}".format(' '.join(str(cn) for cn in change_numbers), e))
+            if len(change_numbers) == 1:
+                return [(None, e)]
+            return [self.__try_change_with_number(change_number) for change_number in change_numbers]
+
+        fetch_seconds = time.time() - start
+
+        results = []
+        for change_number in change_numbers:
+            start = time.time()
+            try:
+                if str(change_number) not in changes_json:
+                    raise LookupError("change not found on Gerrit")
+                results.append((self.change_from_json(changes_json[str(change_number)]), None))
+            except Exception as e:
+                info("[Gerrit] Failed fetching change {0}: {1}".format(change_number, e))
+                results.append((None, e))
+            metrics.record_change(change_number, fetch_seconds + time.time() - start)
+        return results
+
+    def __try_change_with_number(self, change_number):
+        start = time.time()
+        try:
+            return (self.change_with_number(change_number), None)
+        except Exception as e:
+            info("[Gerrit] Failed fetching change {0}: {1}".format(change_number, e))
+            return (None, e)
+        finally:
+            metrics.record_change(change_number, time.time() - start)
+
+
+def split_review_number(review_number):
+    """Splits a review number of the input page, "NUMBER" or "HOST:NUMBER", into its host,
+    None for the default one, and its change number
+    """
+    host, _, change_number = str(review_number).rpartition(':')
+    return (host or None), change_number
+
+
+class MultiHostChangeParser:
+    """Fetches the changes of review numbers of several Gerrit hosts.
+
+    Review numbers are either change numbers of the default host, that of
+    `default_parser`, or "HOST:NUMBER". The changes of HOST are fetched from
+    `host_addresses[HOST]` if given, or from https://HOST. Each host gets its own
+    ChangeParser, made by `change_parser_of(host, address)` when first needed, and so
+    its own connection pool, concurrency, rate limit and cache namespace. The changes
+    of different hosts are fetched in parallel, each host in its own thread.
+    """
+
+    def __init__(self, default_parser, change_parser_of, host_addresses={}):
+        self.default_parser = default_parser
+        self.change_parser_of = change_parser_of
+        self.host_addresses = host_addresses
+        self.parsers_by_host = {None: default_parser}
+        self.errors = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def concurrency(self):
+        return self.default_parser.concurrency
+
+    @property
+    def batch_size(self):
+        return self.default_parser.batch_size
+
+    @property
+    def review_store(self):
+        return self.default_parser.review_store
+
+    def parser_of(self, host):
+        with self.__lock:
+            parser = self.parsers_by_host.get(host)
+            if parser is None:
+                address = self.host_addresses.get(host, "https://" + host)
+                parser = self.parsers_by_host[host] = self.change_parser_of(host, address)
+            return parser
+
+    def parsers(self):
+        with self.__lock:
+            return list(self.parsers_by_host.values())
+
+    def changes_by_number(self, review_numbers):
+        """Like ChangeParser.changes_by_number, keyed and ordered by the given review numbers
+        """
+        review_numbers = list(review_numbers)
+        results_by_host = self.__map_hosts(lambda parser, change_numbers: (parser.changes_by_number(change_numbers), parser.errors),
+                                           review_numbers)
+
+        self.errors = {}
+        changes = OrderedDict()
+        for review_number in review_numbers:
+            host, change_number = split_review_number(review_number)
+            host_changes, host_errors = results_by_host[host]
+            if change_number in host_changes:
+                changes[review_number] = host_changes[change_number]
+            elif change_number in host_errors:
+                self.errors[review_number] = host_errors[change_number]
+        return changes
+
+    def changes_updated_since(self, review_numbers, since):
+        review_numbers = list(review_numbers)
+        updated_by_host = self.__map_hosts(lambda parser, change_numbers: parser.changes_updated_since(change_numbers, since), review_numbers)
+
+        updated = {}
+        for review_number in review_numbers:
+            host, change_number = split_review_number(review_number)
+            if change_number in updated_by_host[host]:
+                updated[review_number] = updated_by_host[host][change_number]
+        return updated
+
+    def forget_changes_other_than(self, review_numbers):
+        """Like ChangeParser.forget_changes_other_than, for the known changes of every host
+        """
+        change_numbers_by_host = {}
+        for review_number in review_numbers:
+            host, change_number = split_review_number(review_number)
+            change_numbers_by_host.setdefault(host, []).append(change_number)
+        with self.__lock:
+            parsers_by_host = dict(self.parsers_by_host)
+        for host, parser in parsers_by_host.items():
+            parser.forget_changes_other_than(change_numbers_by_host.get(host, ()))
+
+    def __map_hosts(self, function, review_numbers):
+        """Calls `function` with the parser and the change numbers of each host of the review numbers, returning their results by host
+        """
+        change_numbers_by_host = OrderedDict()
+        for review_number in review_numbers:
+            host, change_number = split_review_number(review_number)
+            change_numbers_by_host.setdefault(host, []).append(change_number)
+
+        hosts = list(change_numbers_by_host)
+        if len(hosts) <= 1:
+            return dict((host, function(self.parser_of(host), change_numbers_by_host[host])) for host in hosts)
+
+        pool = ThreadPool(len(hosts))
+        try:
+            results = pool.map(lambda host: function(self.parser_of(host), change_numbers_by_host[host]), hosts)
+        finally:
+            pool.close()
+            pool.join()
+        return dict(zip(hosts, results))
 
 
 if __name__ == '__main__':
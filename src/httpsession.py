@@ -0,0 +1,212 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# HTTP client that reuses connections and retries transient errors
+
+from __future__ import print_function
+
+import socket
+import threading
+import time
+import urlparse
+import zlib
+
+from metrics import metrics
+
+def debug(msg):
+    pass
+    #print(msg)
+
+
+class HttpError(Exception):
+    def __init__(self, url, status, reason, headers=None):
+        Exception.__init__(self, "HTTP {0} {1}: {2}".format(status, reason, url))
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+
+def retry_after_seconds(retry_after):
+    """Parses a "Retry-After" header, either in seconds or an HTTP date, into seconds from now
+    """
+    if not retry_after:
+        return None
+    if retry_after.strip().isdigit():
+        return int(retry_after)
+    import email.utils  # rarely needed, and slow to import
+
+    date = email.utils.parsedate_tz(retry_after)
+    if date is None:
+        return None
+    return max(0, email.utils.mktime_tz(date) - time.time())
+
+
+class HttpSession:
+    """Fetches URLs over persistent connections, kept in a pool per host.
+
+    Responses are requested gzip-compressed. Connection errors and the statuses in
+    TRANSIENT_STATUSES are retried up to `retries` times, waiting `backoff` seconds
+    before the first retry and doubling it at each one. It is safe to share a session
+    between threads: each connection is used by one request at a time.
+
+    The latency and size of each response are recorded in metrics under `endpoint`.
+    Redirects are followed up to MAX_REDIRECTS times, and any other status that is not
+    2xx raises an HttpError. The hosts are reached through the proxies of the
+    environment, like $https_proxy, except the ones in $no_proxy.
+
+    The statuses in THROTTLE_STATUSES mean the server is over its quota: they are
+    retried no sooner than their "Retry-After" header asks. With a `rate_limiter`, like
+    an AdaptiveRateLimiter, each attempt waits for it, and it is told of the throttled and the successful requests to adapt its rate.
+    """
+
+    TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+    THROTTLE_STATUSES = (429, 503)
+    REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+    MAX_REDIRECTS = 5
+
+    def __init__(self, timeout=30, retries=3, backoff=0.5, rate_limiter=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter
+        self.__idle_connections = {}
+        self.__proxies = {}
+        self.__lock = threading.Lock()
+
+    # Size of the chunks of the responses read by get_chunks()
+    CHUNK_SIZE = 64 * 1024
+
+    def get(self, url, endpoint='http'):
+        return self.__get(url, endpoint, is_streamed=False)
+
+    def get_chunks(self, url, endpoint='http'):
+        """Like get(), but returns an iterator over the decompressed body, read a chunk at a time.
+
+        The request is retried like with get() until its response starts, but errors
+        while reading the body are raised by the iterator. The connection goes back to
+        the pool once the body is read to its end.
+        """
+        return self.__get(url, endpoint, is_streamed=True)
+
+    def __get(self, url, endpoint, is_streamed, redirects=0):
+        import httplib  # on first use, as only the runs that fetch changes need it
+
+        scheme, host, path, query, _ = urlparse.urlsplit(url)
+        path_and_query = (path or '/') + ('?' + query if query else '')
+        if scheme == 'http' and self.__proxy_of(scheme, host) is not None:
+            path_and_query = url  # plain HTTP proxies are asked for the absolute URL
+
+        for attempt in range(self.retries + 1):
+            is_last_attempt = attempt == self.retries
+            delay = self.backoff * 2 ** attempt
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            connection = self.__acquire(scheme, host)
+            try:
+                start = time.time()
+                connection.request('GET', path_and_query, headers={'Accept-Encoding': 'gzip'})
+                response = connection.getresponse()
+                if is_streamed and 200 <= response.status < 300:
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.succeeded()
+                    return self.__chunks_of(response, connection, scheme, host, endpoint, start)
+                body = response.read()
+                metrics.record_request(endpoint, time.time() - start, len(body))
+            except (httplib.HTTPException, socket.error) as e:
+                connection.close()
+                if is_last_attempt:
+                    raise
+                debug("[HTTP] Retrying {0} after: {1}".format(url, e))
+            else:
+                if response.will_close:
+                    connection.close()
+                else:
+                    self.__release(scheme, host, connection)
+
+                if response.status in self.THROTTLE_STATUSES:
+                    retry_after = retry_after_seconds(response.getheader('Retry-After'))
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.throttled(retry_after)
+                    if retry_after is not None:
+                        delay = max(delay, retry_after)
+                elif 200 <= response.status < 300 and self.rate_limiter is not None:
+                    self.rate_limiter.succeeded()
+
+                location = response.getheader('Location')
+                if response.status in self.REDIRECT_STATUSES and location and redirects < self.MAX_REDIRECTS:
+                    location = urlparse.urljoin(url, location)
+                    debug("[HTTP] Following the redirect of {0} to {1}".format(url, location))
+                    return self.__get(location, endpoint, is_streamed, redirects + 1)
+                if response.status in self.TRANSIENT_STATUSES and not is_last_attempt:
+                    debug("[HTTP] Retrying {0} after status {1} in {2}s".format(url, response.status, delay))
+                elif not 200 <= response.status < 300:
+                    raise HttpError(url, response.status, response.reason, dict(response.getheaders()))
+                else:
+                    if response.getheader('Content-Encoding', '').lower() == 'gzip':
+                        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+                    return body
+
+            time.sleep(delay)
+
+    def __chunks_of(self, response, connection, scheme, host, endpoint, start):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if response.getheader('Content-Encoding', '').lower() == 'gzip' else None
+        size = 0
+        try:
+            while True:
+                chunk = response.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                yield decompressor.decompress(chunk) if decompressor is not None else chunk
+            if decompressor is not None:
+                yield decompressor.flush()
+        except:
+            connection.close()
+            raise
+        metrics.record_request(endpoint, time.time() - start, size)
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.__release(scheme, host, connection)
+
+    def close(self):
+        with self.__lock:
+            for connections in self.__idle_connections.values():
+                for connection in connections:
+                    connection.close()
+            self.__idle_connections = {}
+
+    def __acquire(self, scheme, host):
+        with self.__lock:
+            connections = self.__idle_connections.get((scheme, host))
+            if connections:
+                return connections.pop()
+
+        import httplib
+
+        proxy = self.__proxy_of(scheme, host)
+        if scheme != 'https':
+            return httplib.HTTPConnection(proxy or host, timeout=self.timeout)
+        connection = httplib.HTTPSConnection(proxy or host, timeout=self.timeout)
+        if proxy is not None:
+            connection.set_tunnel(host)
+        return connection
+
+    def __proxy_of(self, scheme, host):
+        """Returns the "host:port" of the proxy of the environment to reach the host through, or None
+        """
+        if (scheme, host) not in self.__proxies:
+            import urllib  # slow to import, and only needed once per host
+
+            proxy = urllib.getproxies_environment().get(scheme)
+            if proxy and not urllib.proxy_bypass_environment(host):
+                proxy = urlparse.urlsplit(proxy if '://' in proxy else 'http://' + proxy).netloc.rpartition('@')[2]
+            else:
+                proxy = None
+            self.__proxies[(scheme, host)] = proxy
+        return self.__proxies[(scheme, host)]
+
+    def __release(self, scheme, host, connection):
+        with self.__lock:
+            self.__idle_connections.setdefault((scheme, host), []).append(connection)
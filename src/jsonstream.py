@@ -0,0 +1,173 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Streaming, field-projected decoding of the JSON responses of Gerrit
+
+from __future__ import print_function
+
+import json
+
+
+class Fields(tuple):
+    """Projection of small objects: each one is decoded whole, then only these fields are kept
+    """
+
+
+# Projection of a value: True keeps it as it is, Fields(...) keeps some fields of an object,
+# [projection] projects each item of an array and a dict projects an object field by field.
+# The "*" entry of a dict projects the fields not named in it, and the others are dropped.
+
+
+class ProjectingDecoder:
+    """Decodes a JSON document from an iterable of chunks of text, keeping only the
+    fields selected by a projection and dropping the others as it goes.
+
+    The document is read a chunk at a time and the consumed text is discarded, so
+    memory is bounded by the largest single value decoded, not by the whole document.
+    Values kept or dropped whole, and objects projected with Fields, are decoded by the
+    json module's scanner; only the objects and arrays projected with dicts and lists
+    are walked here.
+    """
+
+    # Consumed text is dropped from the buffer once there is this much of it
+    COMPACTION_SIZE = 64 * 1024
+
+    WHITESPACE = ' \t\n\r'
+    NUMBER_CHARACTERS = '0123456789.eE+-'
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ''
+        self.position = 0
+        self.is_exhausted = False
+        self.decoder = json.JSONDecoder()
+
+    def decode(self, projection, prefix=''):
+        """Decodes the document after `prefix`, like Gerrit's ")]}'" line, with the given projection
+        """
+        for expected in prefix:
+            if self.__next_character(skip_whitespace=False) != expected:
+                raise ValueError("Expected the prefix " + repr(prefix))
+            self.position += 1
+
+        value = self.__value(projection)
+        if self.__next_character() is not None:
+            raise ValueError("Extra data after the JSON document at " + str(self.position))
+        return value
+
+    def __value(self, projection):
+        character = self.__next_character()
+        if isinstance(projection, dict) and character == '{':
+            return self.__object(projection)
+        if isinstance(projection, list) and character == '[':
+            return self.__array(projection[0])
+
+        value = self.__scanned_value()
+        if isinstance(projection, Fields) and isinstance(value, dict):
+            return dict((name, value[name]) for name in projection if name in value)
+        return value
+
+    def __object(self, projection):
+        self.position += 1  # {
+        obj = {}
+        if self.__next_character() == '}':
+            self.position += 1
+            return obj
+
+        while True:
+            if self.__next_character() != '"':
+                raise ValueError("Expected a field name at " + str(self.position))
+            name = self.__scanned_value()
+            self.__expect(':')
+
+            field_projection = projection.get(name, projection.get('*'))
+            if field_projection is None:
+                self.__scanned_value()
+            else:
+                obj[name] = self.__value(field_projection)
+
+            if self.__expect(',}') == '}':
+                return obj
+
+    def __array(self, item_projection):
+        self.position += 1  # [
+        array = []
+        if self.__next_character() == ']':
+            self.position += 1
+            return array
+
+        while True:
+            array.append(self.__value(item_projection))
+            if self.__expect(',]') == ']':
+                return array
+
+    def __expect(self, characters):
+        character = self.__next_character()
+        if character is None or character not in characters:
+            raise ValueError("Expected one of {0} at {1}".format(repr(characters), self.position))
+        self.position += 1
+        return character
+
+    def __scanned_value(self):
+        """Decodes the value at the current position with the json module, reading more text until it is complete
+        """
+        self.__next_character()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if not self.__read_more():
+                    raise
+                continue
+            # A number at the end of the buffer, or followed only by what may still be part of
+            # it, as in "1." or "1e", may go on in the next chunk
+            if self.__may_go_on(value, end) and self.__read_more():
+                continue
+            self.position = end
+            return value
+
+    def __may_go_on(self, value, end):
+        if end == len(self.buffer):
+            return True
+        if not isinstance(value, (int, long, float)) or isinstance(value, bool):
+            return False
+        return all(character in self.NUMBER_CHARACTERS for character in self.buffer[end:])
+
+    def __next_character(self, skip_whitespace=True):
+        """Returns the character at the current position, after whitespace, or None at the end of the document
+        """
+        while True:
+            if skip_whitespace:
+                while self.position < len(self.buffer) and self.buffer[self.position] in self.WHITESPACE:
+                    self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.__read_more():
+                return None
+
+    def __read_more(self):
+        """Appends at least as much text as is not consumed yet to the buffer, so long
+        values are rescanned a logarithmic number of times. Returns False at the end.
+        """
+        if self.is_exhausted:
+            return False
+
+        if self.position >= self.COMPACTION_SIZE:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+
+        pending = [self.buffer]
+        wanted = max(1, len(self.buffer) - self.position)
+        read = 0
+        for chunk in self.chunks:
+            pending.append(chunk)
+            read += len(chunk)
+            if read >= wanted:
+                break
+        else:
+            self.is_exhausted = True
+        self.buffer = ''.join(pending)
+        return read > 0 or not self.is_exhausted
+
+
+def decode_projected(chunks, projection, prefix=''):
+    return ProjectingDecoder(chunks).decode(projection, prefix)
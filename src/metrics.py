@@ -0,0 +1,127 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Timing and HTTP metrics of a gerrit-bot run
+
+from __future__ import print_function
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return None
+    rank = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+
+class Metrics:
+    """Collects the time spent on each phase of a run, the requests made to each
+    endpoint and the time taken by each change. It is safe to use from threads.
+
+    Phases may nest and may run in several threads at once, in which case their times
+    are summed, e.g. "json decode" is part of "gerrit fetch".
+    """
+
+    def __init__(self):
+        self.phase_seconds = OrderedDict()
+        self.requests_by_endpoint = OrderedDict()
+        self.change_seconds = {}
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.time() - start)
+
+    def record_phase(self, name, seconds):
+        with self.__lock:
+            self.phase_seconds[name] = self.phase_seconds.get(name, 0) + seconds
+
+    def record_request(self, endpoint, seconds, size):
+        with self.__lock:
+            requests = self.requests_by_endpoint.setdefault(endpoint, {"latencies": [], "bytes": 0})
+            requests["latencies"].append(seconds)
+            requests["bytes"] += size
+
+    def record_change(self, change_number, seconds):
+        with self.__lock:
+            self.change_seconds[str(change_number)] = self.change_seconds.get(str(change_number), 0) + seconds
+
+    def reset(self):
+        """Forgets everything collected so far, as at the start of each cycle of a daemon
+        """
+        with self.__lock:
+            self.phase_seconds = OrderedDict()
+            self.requests_by_endpoint = OrderedDict()
+            self.change_seconds = {}
+
+    def is_empty(self):
+        with self.__lock:
+            return not (self.phase_seconds or self.requests_by_endpoint or self.change_seconds)
+
+    def report(self, slowest=10):
+        """Returns the metrics as a dict that can be serialized to JSON
+        """
+        with self.__lock:
+            endpoints = OrderedDict()
+            for endpoint, requests in self.requests_by_endpoint.items():
+                latencies = sorted(requests["latencies"])
+                endpoints[endpoint] = OrderedDict([
+                    ("requests", len(latencies)),
+                    ("bytes", requests["bytes"]),
+                    ("latency_p50", percentile(latencies, 0.50)),
+                    ("latency_p90", percentile(latencies, 0.90)),
+                    ("latency_p99", percentile(latencies, 0.99)),
+                    ("latency_max", latencies[-1] if latencies else None),
+                ])
+
+            slowest_changes = sorted(self.change_seconds.items(), key=lambda item: item[1], reverse=True)[:slowest]
+            return OrderedDict([
+                ("phases", OrderedDict(self.phase_seconds)),
+                ("endpoints", endpoints),
+                ("slowest_changes", [OrderedDict([("change", c), ("seconds", s)]) for c, s in slowest_changes]),
+            ])
+
+    def summary_lines(self, slowest=10):
+        report = self.report(slowest)
+        lines = ["Phases:"]
+        lines.extend("  {0}: {1:.3f}s".format(name, seconds) for name, seconds in report["phases"].items())
+        lines.append("Requests:")
+        for endpoint, requests in report["endpoints"].items():
+            lines.append("  {0}: {1} requests, {2} bytes, latency p50 {3:.3f}s p90 {4:.3f}s p99 {5:.3f}s max {6:.3f}s".format(
+                endpoint, requests["requests"], requests["bytes"], requests["latency_p50"], requests["latency_p90"],
+                requests["latency_p99"], requests["latency_max"]))
+        lines.append("Slowest changes:")
+        lines.extend("  {0}: {1:.3f}s".format(c["change"], c["seconds"]) for c in report["slowest_changes"])
+        return lines
+
+
+class TimedIterator(object):
+    """Iterates over `iterable`, adding up in `seconds` the time spent waiting for its items
+    """
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.seconds = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        start = time.time()
+        try:
+            return next(self.iterator)
+        finally:
+            self.seconds += time.time() - start
+
+
+# Metrics of the current run, shared by the Gerrit and Redmine clients
+metrics = Metrics()
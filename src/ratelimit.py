@@ -0,0 +1,112 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Rate limiting of the requests to the servers gerrit-bot talks to
+
+from __future__ import print_function
+
+import threading
+import time
+
+from metrics import metrics
+
+
+class TokenBucket:
+    """Lets through `rate` acquisitions per second on average, in bursts of up to
+    `capacity`. It is safe to share between threads.
+
+    The time spent waiting for tokens is recorded in metrics under the phase `name`.
+    """
+
+    def __init__(self, rate, capacity=None, name='rate limit wait'):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1, rate))
+        self.name = name
+        self.__tokens = self.capacity
+        self.__last_refill = time.time()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        with metrics.phase(self.name):
+            while True:
+                with self.__lock:
+                    self.__refill()
+                    if self.__tokens >= 1:
+                        self.__tokens -= 1
+                        return
+                    wait = (1 - self.__tokens) / self.rate
+                time.sleep(wait)
+
+    def __refill(self):
+        now = time.time()
+        self.__tokens = min(self.capacity, self.__tokens + (now - self.__last_refill) * self.rate)
+        self.__last_refill = now
+
+
+class AdaptiveRateLimiter:
+    """Spaces requests to a server at up to `max_rate` per second, adapting to its quota.
+
+    When the server throttles a request, like with HTTP 429 or 503, the rate is halved,
+    at most once per second so that requests already in flight do not halve it again,
+    and no request is let through before its "Retry-After" time. Each request that
+    succeeds raises the rate back by `max_rate` / RECOVERY_REQUESTS, up to three
+    quarters of the rate that was throttled, and from there by 1 / PROBE_REQUESTS of
+    itself per request. So it stays close to the most the server allows, only probing
+    beyond it slowly.
+
+    It is safe to share between threads. The time spent waiting is recorded in metrics
+    under the phase `name`.
+    """
+
+    RECOVERY_REQUESTS = 20
+    PROBE_REQUESTS = 2000
+
+    def __init__(self, max_rate, min_rate=0.1, name='rate limit wait'):
+        self.max_rate = float(max_rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.rate = self.max_rate
+        self.__ceiling = self.max_rate
+        self.name = name
+        self.__tokens = 1.0
+        self.__last_refill = time.time()
+        self.__last_slowdown = 0
+        self.__paused_until = 0
+        self.__condition = threading.Condition()
+
+    def acquire(self):
+        with metrics.phase(self.name):
+            with self.__condition:
+                while True:
+                    now = time.time()
+                    self.__refill(now)
+                    if now >= self.__paused_until and self.__tokens >= 1:
+                        self.__tokens -= 1
+                        return
+                    self.__condition.wait(max(self.__paused_until - now, (1 - self.__tokens) / self.rate, 0.01))
+
+    def throttled(self, retry_after=None):
+        """Slows down after the server refused a request, pausing for `retry_after` seconds if given
+        """
+        with self.__condition:
+            now = time.time()
+            if now - self.__last_slowdown >= 1:
+                self.__refill(now)
+                self.__ceiling = max(self.min_rate, self.rate * 0.75)
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.__last_slowdown = now
+            if retry_after is not None:
+                self.__paused_until = max(self.__paused_until, now + retry_after)
+            self.__tokens = min(self.__tokens, 0)
+
+    def succeeded(self):
+        with self.__condition:
+            self.__refill(time.time())
+            if self.rate < self.__ceiling:
+                self.rate = min(self.__ceiling, self.rate + self.max_rate / self.RECOVERY_REQUESTS)
+            else:
+                self.__ceiling = min(self.max_rate, self.__ceiling + self.__ceiling / self.PROBE_REQUESTS)
+                self.rate = self.__ceiling
+
+    def __refill(self, now):
+        # A single token at most, so requests are evenly spaced instead of sent in bursts
+        self.__tokens = min(1.0, self.__tokens + (now - self.__last_refill) * self.rate)
+        self.__last_refill = now
@@ -6,126 +6,777 @@ from __future__ import print_function
 
 import time
 import argparse
+import hashlib
+import os.path
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
 from os import environ as env
-from redmine import Redmine
 
-from gerriter import ChangeParser
+from analytics import VOTES, ReviewColumns, reviewer_statistics_of, seconds_since_epoch
+from botstate import load_json, save_json
+from changecache import ChangeCache
+from eventstream import EventIngester, EventStream
+from gerriter import DEFAULT_GERRIT_ADDRESS, ChangeParser, Gerrit, MultiHostChangeParser, parse_gerrit_timestamp, split_review_number
+from httpsession import HttpSession
 from inputparser import ParsedInputPage
+from metrics import metrics
+from ratelimit import AdaptiveRateLimiter, TokenBucket
+from reviewstore import ReviewStore
 
 
 # Wiki and Report abstraction
 
+def content_fingerprint(wiki_text):
+    """Hashes a page's text ignoring its line endings and its "Last updated on" line
+    """
+    lines = wiki_text.replace('\r', '').split('\n')
+    content = '\n'.join(line for line in lines if not line.startswith('Last updated on: ')).strip()
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
 class ReportPage:
-    def __init__(self, report_item, changes, page_timestamp, emails_to_skip=[]):
+    """A report of the reviews of the changes listed on a row of the input page.
+
+    Its rows follow the order of the review numbers of the row. Those missing from
+    `changes_by_number` are taken from `previous_rows_by_change_number`, the rows
+    rendered on a previous run, if there.
+
+    With a `review_store`, the rows of the changes in the store come from a query of
+    it instead, whether they are in `changes_by_number` or not. With a `row_cache`, the
+    rows of the reviews rendered before are reused instead of formatted again.
+
+    With `reviewer_summary`, a second table summarizes the reviews of each reviewer,
+    taken from the same sources as the rows, `previous_reviews_by_change_number` being
+    those of the previous rows.
+    """
+
+    REVIEWER_EMAIL_SUFFIX = "@lsd.ufcg.edu.br"
+
+    TABLE_HEADER = "|_{background:#ffa}.Reviewer|_{background:#ffa}.Review|_{background:#ffa}.Project|_{background:#ffa}.Patch|" \
+                   "_{background:#ffa}.Revision score|_{background:#ffa}.Comment|"
+
+    SUMMARY_TABLE_HEADER = "|_{background:#ffa}.Reviewer|_{background:#ffa}.Reviews|" + \
+                           "".join("_{background:#ffa}." + ("{0:+d}".format(v) if v else "0") + "|" for v in VOTES) + \
+                           "_{background:#ffa}.Median time to review|_{background:#ffa}.Projects|"
+
+    def __init__(self, report_item, changes_by_number, page_timestamp, emails_to_skip=[], previous_rows_by_change_number={}, review_store=None,
+                 row_cache=None, reviewer_summary=False, previous_reviews_by_change_number={}):
         self.report_item = report_item
         self.title = report_item.wiki_page
-        self.changes = changes
+        self.changes_by_number = changes_by_number
         self.page_timestamp = page_timestamp
         self.emails_to_skip = emails_to_skip
+        self.previous_rows_by_change_number = previous_rows_by_change_number
+        self.review_store = review_store
+        self.row_cache = row_cache
+        self.reviewer_summary = reviewer_summary
+        self.previous_reviews_by_change_number = previous_reviews_by_change_number
+        self.__rows_by_change_number = None
+        self.__reviews_by_change_number = None
 
     def wiki_text(self):
-        return self.__crlf_ed(self.__template_with(self.title, self.__change_rows(), self.page_timestamp))
-
-    def __change_rows(self):
-        def review_filter(review):
-            return review.author.email.endswith("@lsd.ufcg.edu.br") and \
-                   (review.author.email not in self.emails_to_skip) and \
-                   (self.report_item.from_time <= review.timestamp if self.report_item.from_time != None else True) and \
-                   (review.timestamp <= self.report_item.until_time  if self.report_item.until_time != None else True)
+        """Joins the lines of the page, with its rows, at once
+        """
+        lines = ["h1. " + self.title, "", "table{border:1px bordercolor:darkblue}.", self.TABLE_HEADER]
+        lines.extend(row for rows in self.rows_by_change_number().values() for row in rows)
+        if len(lines) == 4:
+            lines.append("")  # where the rows would be
+        if self.reviewer_summary:
+            lines.extend(self.__summary_lines())
+        lines.extend(["", "Last updated on: " + time.strftime("%Y-%m-%d %H:%M:%S %Z", self.page_timestamp)])
+        return '\r\n'.join(lines)
+
+    def rows_by_change_number(self):
+        if self.__rows_by_change_number is None:
+            stored_change_numbers, stored_rows, stored_reviews = self.__stored_rows()
+            self.__rows_by_change_number = OrderedDict()
+            self.__reviews_by_change_number = {}
+            for change_number in self.report_item.review_numbers:
+                if change_number in self.__rows_by_change_number:
+                    continue
+                if change_number in stored_change_numbers:
+                    self.__rows_by_change_number[change_number] = stored_rows.get(change_number, [])
+                    self.__reviews_by_change_number[change_number] = stored_reviews.get(change_number, [])
+                elif change_number in self.changes_by_number:
+                    change = self.changes_by_number[change_number]
+                    self.__rows_by_change_number[change_number] = self.__change_rows(change_number, change)
+                    if self.reviewer_summary:
+                        self.__reviews_by_change_number[change_number] = self.__change_reviews(change)
+                elif change_number in self.previous_rows_by_change_number:
+                    self.__rows_by_change_number[change_number] = self.previous_rows_by_change_number[change_number]
+                    self.__reviews_by_change_number[change_number] = self.previous_reviews_by_change_number.get(change_number, [])
+        return self.__rows_by_change_number
+
+    def reviews_by_change_number(self):
+        """The reviews of the rows, with reviewer_summary, as [author email, author name, project, vote,
+        time, upload time of the revision] lists, times in seconds since the epoch or None if unknown
+        """
+        self.rows_by_change_number()
+        return self.__reviews_by_change_number
+
+    def __summary_lines(self):
+        columns = ReviewColumns()
+        with metrics.phase("analytics"):
+            for reviews in self.reviews_by_change_number().values():
+                for author_email, author_name, project, vote, timestamp, revision_created in reviews:
+                    columns.append(author_email, author_name, project, vote, timestamp, revision_created)
+            statistics = reviewer_statistics_of(columns)
+        if not statistics:
+            return []
+
+        lines = ["", "h2. Reviewers", "", "table{border:1px bordercolor:darkblue}.", self.SUMMARY_TABLE_HEADER]
+        for s in statistics:
+            median = "{0:.1f} h".format(s.median_time_to_review / 3600) if s.median_time_to_review is not None else ""
+            projects = ", ".join("{0} ({1})".format(project, count) for project, count in s.reviews_by_project)
+            lines.append("|" + s.name + "|" + str(s.reviews) + "|" + "|".join(str(count) for count in s.votes) + "|" + median + "|" + projects + "|")
+        return lines
+
+    def __stored_rows(self):
+        if self.review_store is None:
+            return set(), {}, {}
+
+        report_item = self.report_item
+        stored_change_numbers = self.review_store.stored_change_numbers(report_item.review_numbers)
+        reviews_by_change_number = self.review_store.reviews_of(stored_change_numbers, report_item.from_time, report_item.until_time,
+                                                                self.REVIEWER_EMAIL_SUFFIX, self.emails_to_skip)
+        stored_rows = {}
+        stored_reviews = {}
+        for change_number, reviews in reviews_by_change_number.items():
+            change_cells = None
+            rows = stored_rows[change_number] = []
+            for r in reviews:
+                if change_cells is None:
+                    change_cells = self.__change_cells(split_review_number(r.change_number)[1], r.subject, r.permalink, r.project)
+                rows.append(self.__row_of(r.author_name, change_cells, r.revision_number, r.vote, r.comment))
+            if self.reviewer_summary:
+                stored_reviews[change_number] = [
+                    [r.author_email, r.author_name, r.project, int(r.vote), seconds_since_epoch(parse_gerrit_timestamp(r.timestamp)),
+                     seconds_since_epoch(parse_gerrit_timestamp(r.revision_created)) if r.revision_created else None] for r in reviews]
+        return stored_change_numbers, stored_rows, stored_reviews
+
+    def __is_reported(self, review):
+        return review.author.email.endswith(self.REVIEWER_EMAIL_SUFFIX) and \
+               (review.author.email not in self.emails_to_skip) and \
+               (self.report_item.from_time <= review.timestamp if self.report_item.from_time != None else True) and \
+               (review.timestamp <= self.report_item.until_time  if self.report_item.until_time != None else True)
+
+    def __change_rows(self, change_number, change):
+        review_filter = self.__is_reported
+
+        change_cells = self.__change_cells(change.number, change.subject, change.permalink(), change.project)
+        cached_rows = self.row_cache.rows_of(change_number, change_cells) if self.row_cache is not None else {}
 
         change_rows = []
-        for change in self.changes:
-            for revision in change.revisions:
-                for review in revision.reviews:
-                    if review_filter(review):
-                        # | Reviewer | Review | Project | Patch | Revision score | Comment |
-                        reviewer = review.author.name.split()[0]
-                        rev = '"' + (str(change.number) + ': ' + change.subject).replace('"', '') + '":' + change.permalink()
-                        project = change.project
-                        patch = str(revision.number)
-                        score = review.vote()
-                        comment = review.message_without_vote().replace('\n', ' ')
-
-                        change_rows.append("|" + reviewer + "|" + rev + "|" + project + "|" + patch + "|" + score + "|" + comment + "|")
+        for revision in change.revisions:
+            for review in revision.reviews:
+                if review_filter(review):
+                    key = (revision.number, review.timestamp, review.author.email, review.author.name, review.message)
+                    row = cached_rows.get(key)
+                    if row is None:
+                        row = cached_rows[key] = self.__row_of(review.author.name, change_cells, revision.number, review.vote(),
+                                                               review.message_without_vote())
+                    change_rows.append(row)
 
         return change_rows
 
-    def __template_with(self, title, change_rows, page_timestamp):
-        time_string = time.strftime("%Y-%m-%d %H:%M:%S %Z", page_timestamp)
-        template = \
-"""h1. $title$
+    def __change_reviews(self, change):
+        return [[review.author.email, review.author.name, change.project, review.value, seconds_since_epoch(review.timestamp),
+                 seconds_since_epoch(revision.created)]
+                for revision in change.revisions for review in revision.reviews if self.__is_reported(review)]
+
+    def __change_cells(self, change_number, subject, permalink, project):
+        # The Review and Project cells, the same in all rows of a change
+        rev = '"' + (str(change_number) + ': ' + subject).replace('"', '') + '":' + permalink
+        return rev + "|" + project
+
+    def __row_of(self, author_name, change_cells, revision_number, vote, comment):
+        # | Reviewer | Review | Project | Patch | Revision score | Comment |
+        reviewer = author_name.split()[0]
+        patch = str(revision_number)
+        comment = comment.replace('\n', ' ')
+
+        return "|" + reviewer + "|" + change_cells + "|" + patch + "|" + vote + "|" + comment + "|"
+
+
+class RenderedRowCache:
+    """Rows rendered for the reviews of the most recently rendered changes, so those of
+    the reviews that did not change are not formatted again.
 
-table{border:1px bordercolor:darkblue}.
-|_{background:#ffa}.Reviewer|_{background:#ffa}.Review|_{background:#ffa}.Project|_{background:#ffa}.Patch|_{background:#ffa}.Revision score|_{background:#ffa}.Comment|
-$change_rows$
+    The rows of each change are kept under its review number, keyed by their revision
+    number, time, author email and name, and message, and are dropped when the cells of the
+    change itself, its subject, link or project, change. The rows of up to
+    `max_changes` changes are kept, dropping those of the least recently used ones.
 
-Last updated on: $page_timestamp$"""
-        return template.replace('$title$', title).replace('$change_rows$', '\n'.join(change_rows)).replace('$page_timestamp$', time_string)
+    It is only kept in memory: a single run reuses the rows between the reports that list
+    the same change, a daemon also between its cycles. Formatting a row costs less than
+    reading it back from disk would.
+    """
 
-    def __crlf_ed(self, text):
-        return text.replace('\n', '\r\n')
+    def __init__(self, max_changes=10000):
+        self.max_changes = max_changes
+        self.__cells_and_rows_by_review_number = OrderedDict()
+
+    def rows_of(self, review_number, change_cells):
+        """Returns the dict of the cached rows of a change, for the caller to read and fill
+        """
+        cells_and_rows = self.__cells_and_rows_by_review_number.pop(review_number, None)
+        if cells_and_rows is None or cells_and_rows[0] != change_cells:
+            cells_and_rows = (change_cells, {})
+        self.__cells_and_rows_by_review_number[review_number] = cells_and_rows
+
+        while len(self.__cells_and_rows_by_review_number) > self.max_changes:
+            self.__cells_and_rows_by_review_number.popitem(last=False)
+        return cells_and_rows[1]
 
 
 class RedmineWiki:
-    def __init__(self, redmine, project_name):
+    """Redmine wiki of a project. The latency and size of its requests are recorded in metrics.
+
+    With a `rate_limiter`, each request first acquires a token from it.
+    """
+
+    def __init__(self, redmine, project_name, rate_limiter=None):
         self.redmine = redmine
+        self.rate_limiter = rate_limiter
 
+        self.__wait_for_rate_limit()
+        start = time.time()
         project = self.redmine.project.get(project_name)
+        metrics.record_request("redmine project", time.time() - start, 0)
         self.project_id = project.id
 
     def create_or_update(self, title, wiki_text):
-        return self.redmine.wiki_page.update(title, text=wiki_text, project_id=self.project_id)
+        self.__wait_for_rate_limit()
+        start = time.time()
+        result = self.redmine.wiki_page.update(title, text=wiki_text, project_id=self.project_id)
+        metrics.record_request("redmine update", time.time() - start, len(wiki_text.encode('utf-8')))
+        return result
 
     def get(self, title):
-        return self.redmine.wiki_page.get(title, project_id=self.project_id)
+        self.__wait_for_rate_limit()
+        start = time.time()
+        page = None
+        try:
+            page = self.redmine.wiki_page.get(title, project_id=self.project_id)
+            return page
+        finally:
+            size = len(page.text.encode('utf-8')) if page is not None else 0
+            metrics.record_request("redmine get", time.time() - start, size)
 
+    def text_of(self, title):
+        from redmine.exceptions import ResourceNotFoundError
 
-# Action
+        try:
+            return self.get(title).text
+        except ResourceNotFoundError:
+            return None
+
+    def __wait_for_rate_limit(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
 
-redmine_address = env['REDMINE_ADDRESS']
-redmine_key = env['REDMINE_KEY']
-project_name = env['REDMINE_PROJECT']
-input_page_name = env['REDMINE_INPUT_PAGE']
-emails_to_skip = [e.strip() for e in env.get('EMAILS_TO_SKIP', '').split(',') if len(e.strip()) > 0]
 
-arg_parser = argparse.ArgumentParser()
-arg_parser.add_argument('-n', '--dry-run', action='store_true', help='does not write reports back to Redmine')
-arg_parser.add_argument('-s', '--std-out', action='store_true', help='prints reports on standard output')
-arg_parser.add_argument('-I', '--ignore-should-be-updated', action='store_true', help='ignores "Should be updated" column of input table and updates all reports. USE WITH CAUTION!')
-args = arg_parser.parse_args()
+# Action
 
-wiki = RedmineWiki(Redmine(redmine_address, key=redmine_key, requests={'verify': False}), project_name)
+def redmine_title_of(report_item):
+    return report_item.wiki_page.replace('.', '')  # because Redmine does it automatically in the HTML interface but not in the API
 
-print("Fetching input page from Redmine.")
-input_page = wiki.get(input_page_name)
 
-print("Parsing input page.")
-parsed_input_page = ParsedInputPage(input_page.text)
+class ReportUpdater:
+    """Builds reports and writes them to Redmine.
 
-print("Start updating the report of code reviews.")
-change_parser = ChangeParser()
-for report_item in parsed_input_page.report_items:
-    if report_item.should_be_updated or args.ignore_should_be_updated:
-        print("Fetching: {0}".format(report_item.wiki_page))
-        timestamp = time.localtime()
-        changes = change_parser.changes(set(report_item.review_numbers))
+    Pages are written by up to --redmine-concurrency threads, each failed write being
+    retried --redmine-retries times with exponential backoff. Those that still fail
+    are kept in a retry queue and written again on the next update.
 
-        report_page = ReportPage(report_item, changes, timestamp, emails_to_skip)
-        page_title = report_page.title.replace('.', '')  # because Redmine does it automatically in the HTML interface but not in the API
-        page_text = report_page.wiki_text()
+    The fingerprints of the published pages and the watermarks of the incremental
+    reports are loaded once and kept up to date between calls of update(), so a
+    long-running process does not reload them at each cycle.
+    """
 
-        if args.std_out:
-            print(unicode('"{0}"\'s text:\n{1}').format(page_title, page_text))
+    # Seconds to wait before retrying a failed write, doubled at each retry
+    RETRY_BACKOFF = 1
 
-        if args.dry_run:
+    def __init__(self, wiki, change_parser, emails_to_skip, args):
+        self.wiki = wiki
+        self.change_parser = change_parser
+        self.emails_to_skip = emails_to_skip
+        self.args = args
+
+        # Fingerprints of the pages last written, to skip writing them again when nothing changed
+        self.published_fingerprints_path = os.path.join(args.state_dir, 'published-pages.json') if args.state_dir else None
+        self.published_fingerprints = load_json(self.published_fingerprints_path, {}) if self.published_fingerprints_path else {}
+
+        # Watermarks of the reports built incrementally: when they were last built, from which
+        # filter, their rendered rows and, with --reviewer-summary, their reviews. Reports whose
+        # filter changed are rebuilt in full.
+        self.watermarks_path = os.path.join(args.state_dir, 'report-watermarks.json') if args.state_dir else None
+        self.watermarks = load_json(self.watermarks_path, {}) if args.incremental else {}
+
+        # Texts of the pages that could not be written, to write them again on the next update
+        self.retry_queue_path = os.path.join(args.state_dir, 'redmine-retry-queue.json') if args.state_dir else None
+        self.retry_queue = load_json(self.retry_queue_path, {}) if self.retry_queue_path else {}
+
+        # Rows of the reviews already rendered, shared by the reports and kept between updates
+        self.row_cache = RenderedRowCache()
+
+    def update(self, report_items_to_update):
+        """Updates the reports of the given items and returns the titles of those that are up to date on Redmine
+        """
+        args = self.args
+        change_parser = self.change_parser
+
+        # The reports not marked "Should be updated", only here because of -I, go last
+        report_items_to_update = sorted(report_items_to_update, key=lambda report_item: not report_item.should_be_updated)
+
+        watermarks_of_reports = []
+        for report_item in report_items_to_update:
+            watermark = self.watermarks.get(redmine_title_of(report_item)) if args.incremental else None
+            is_reusable = watermark is not None and watermark["filter"] == self.__filter_key_of(report_item) and \
+                          (not args.reviewer_summary or "reviews" in watermark)
+            watermarks_of_reports.append(watermark if is_reusable else None)
+
+        # Gerrit's clock may be ahead of ours, so the next watermark starts a bit earlier than this run
+        next_watermark_since = (datetime.utcnow() - timedelta(minutes=5)).strftime("%Y-%m-%d %H:%M:%S")
+
+        updated_since_watermarks = {}
+        review_numbers_with_watermark = set()
+        for report_item, watermark in zip(report_items_to_update, watermarks_of_reports):
+            if watermark is not None:
+                review_numbers_with_watermark.update(set(report_item.review_numbers).intersection(watermark["rows"]))
+        if review_numbers_with_watermark:
+            oldest_watermark_since = min(w["since"] for w in watermarks_of_reports if w is not None)
+            print("Checking {0} changes for updates since {1} UTC.".format(len(review_numbers_with_watermark), oldest_watermark_since))
+            try:
+                with metrics.phase("gerrit fetch"):
+                    updated_since_watermarks = change_parser.changes_updated_since(review_numbers_with_watermark, oldest_watermark_since)
+            except Exception as e:
+                print("Failed checking changes for updates: {0}. Rebuilding the reports in full.".format(e))
+                watermarks_of_reports = [None] * len(report_items_to_update)
+
+        def review_numbers_to_fetch_of(report_item, watermark):
+            if watermark is None:
+                return set(report_item.review_numbers)
+            return set(n for n in report_item.review_numbers if n not in watermark["rows"] or updated_since_watermarks.get(n, "") >= watermark["since"])
+
+        not_rebuilt_pages = []
+        if args.incremental:
+            report_items_to_update, watermarks_of_reports, not_rebuilt_pages = self.__diff_input_rows(
+                report_items_to_update, watermarks_of_reports, review_numbers_to_fetch_of, next_watermark_since)
+
+        # Each change is fetched only once, even if it is listed on several reports
+        review_numbers_of_reports = [review_numbers_to_fetch_of(r, w) for r, w in zip(report_items_to_update, watermarks_of_reports)]
+        all_review_numbers = set().union(*review_numbers_of_reports)
+        avoided_fetches = sum(len(review_numbers) for review_numbers in review_numbers_of_reports) - len(all_review_numbers)
+
+        # Merged changes do not move, so those already in the review store are not fetched again
+        review_store = change_parser.review_store
+        if review_store is not None:
+            with metrics.phase("review store"):
+                stored_final_review_numbers = review_store.final_change_numbers(all_review_numbers)
+            if stored_final_review_numbers:
+                print("Reading {0} merged changes from the review store.".format(len(stored_final_review_numbers)))
+                all_review_numbers -= stored_final_review_numbers
+
+        print("Fetching {0} changes from Gerrit.".format(len(all_review_numbers)))
+
+        # Reports are built and handed to the publishers group by group, so pages are written
+        # to Redmine while the changes of the next group are still being fetched from Gerrit
+        changes_by_number = {}
+        fetch_errors = {}
+        publisher_pool = ThreadPool(max(1, args.redmine_concurrency))
+        publications = []
+        try:
+            for group in self.__groups_to_fetch_together(report_items_to_update, review_numbers_of_reports, watermarks_of_reports, all_review_numbers):
+                group_review_numbers = set().union(*(review_numbers for _, review_numbers, _ in group)).intersection(all_review_numbers)
+                with metrics.phase("gerrit fetch"):
+                    changes_by_number.update(change_parser.changes_by_number(group_review_numbers - set(changes_by_number) - set(fetch_errors)))
+                fetch_errors.update(change_parser.errors)
+
+                for report_item, review_numbers, watermark in group:
+                    print("Building: {0}".format(report_item.wiki_page))
+                    failed_review_numbers = review_numbers.intersection(fetch_errors)
+                    if failed_review_numbers:
+                        print("Failed fetching changes {0} for {1}. Skipping it.".format(
+                            ', '.join(sorted(failed_review_numbers)), report_item.wiki_page))
+                        continue
+
+                    timestamp = time.localtime()
+                    previous_rows = watermark["rows"] if watermark is not None else {}
+                    previous_reviews = watermark.get("reviews", {}) if watermark is not None else {}
+
+                    report_page = ReportPage(report_item, changes_by_number, timestamp, self.emails_to_skip, previous_rows, review_store,
+                                             self.row_cache, args.reviewer_summary, previous_reviews)
+                    page_title = redmine_title_of(report_item)
+                    with metrics.phase("render"):
+                        page_text = report_page.wiki_text()
+                    new_watermark = {"since": next_watermark_since, "filter": self.__filter_key_of(report_item), "item": report_item.fingerprint(),
+                                     "rows": report_page.rows_by_change_number()}
+                    if args.reviewer_summary:
+                        new_watermark["reviews"] = report_page.reviews_by_change_number()
+
+                    if args.std_out:
+                        print(unicode('"{0}"\'s text:\n{1}').format(page_title, page_text))
+
+                    publications.append((page_title, publisher_pool.apply_async(self.__publish, (page_title, page_text, new_watermark))))
+
+            # Pages that failed to be written before and were not rebuilt now are written as they were
+            if not args.dry_run:
+                published_titles = set(title for title, _ in publications)
+                for page_title, page_text in self.retry_queue.items():
+                    if page_title not in published_titles:
+                        print("Retrying: {0}".format(page_title))
+                        publications.append((page_title, publisher_pool.apply_async(self.__publish, (page_title, page_text, None))))
+        finally:
+            publisher_pool.close()
+            publisher_pool.join()
+
+        outcomes = [(page_title, publication.get()) for page_title, publication in publications]
+        up_to_date_pages = not_rebuilt_pages + [page_title for page_title, outcome in outcomes if outcome != "failed"]
+        written_pages = [page_title for page_title, outcome in outcomes if outcome == "written"]
+        unchanged_pages = [page_title for page_title, outcome in outcomes if outcome == "unchanged"]
+        failed_pages = [page_title for page_title, outcome in outcomes if outcome == "failed"]
+
+        if args.state_dir and not args.dry_run:
+            save_json(self.published_fingerprints_path, self.published_fingerprints)
+            save_json(self.retry_queue_path, self.retry_queue)
+        if args.incremental and not args.dry_run:
+            save_json(self.watermarks_path, self.watermarks)
+
+        print("Fetched {0} changes, avoiding {1} duplicate fetches.".format(len(all_review_numbers), avoided_fetches))
+        print("Wrote {0} pages, skipped {1} unchanged pages.".format(len(written_pages), len(unchanged_pages)))
+        if failed_pages:
+            print("Failed writing {0} pages, to be retried: {1}".format(len(failed_pages), ', '.join(failed_pages)))
+        return up_to_date_pages
+
+    def __diff_input_rows(self, report_items, watermarks_of_reports, review_numbers_to_fetch_of, next_watermark_since):
+        """Compares the rows of the input page with those the reports were last built from, and
+        returns the reports and watermarks of those to rebuild: the rows that are new or changed,
+        and the unchanged ones whose changes had activity since. The others are up to date on
+        Redmine, so only their watermarks move on.
+        """
+        new_rows = changed_rows = 0
+        rebuilt = []
+        skipped_pages = []
+        for report_item, watermark in zip(report_items, watermarks_of_reports):
+            page_title = redmine_title_of(report_item)
+            stored_watermark = self.watermarks.get(page_title)
+            if stored_watermark is None:
+                new_rows += 1
+            elif watermark is None or watermark.get("item") != report_item.fingerprint():
+                changed_rows += 1
+            elif not review_numbers_to_fetch_of(report_item, watermark) and not self.args.always_write \
+                    and page_title in self.published_fingerprints and page_title not in self.retry_queue:
+                skipped_pages.append(page_title)
+                self.watermarks[page_title] = dict(watermark, since=next_watermark_since)
+                continue
+            rebuilt.append((report_item, watermark))
+
+        print("Input rows: {0} new, {1} changed, {2} unchanged.".format(new_rows, changed_rows, len(report_items) - new_rows - changed_rows))
+        if skipped_pages:
+            print("Not rebuilding {0} reports with unchanged rows and no new activity.".format(len(skipped_pages)))
+        return [report_item for report_item, _ in rebuilt], [watermark for _, watermark in rebuilt], skipped_pages
+
+    def __groups_to_fetch_together(self, report_items, review_numbers_of_reports, watermarks_of_reports, all_review_numbers):
+        """Splits the reports in groups, in order, each with enough new changes to keep all
+        of the parser's concurrent requests busy with full batches
+        """
+        group_size = self.change_parser.concurrency * self.change_parser.batch_size
+        group = []
+        group_review_numbers = set()
+        for report_item, review_numbers, watermark in zip(report_items, review_numbers_of_reports, watermarks_of_reports):
+            group.append((report_item, review_numbers, watermark))
+            group_review_numbers.update(review_numbers.intersection(all_review_numbers))
+            if len(group_review_numbers) >= group_size:
+                yield group
+                all_review_numbers = all_review_numbers - group_review_numbers
+                group = []
+                group_review_numbers = set()
+        if group:
+            yield group
+
+    def __publish(self, page_title, page_text, new_watermark):
+        """Writes a page to Redmine unless its content did not change, retrying with backoff.
+
+        Returns "written", "unchanged", "failed" or, with --dry-run, "not written".
+        """
+        args = self.args
+        fingerprint = content_fingerprint(page_text)
+        error = None
+        for attempt in range(args.redmine_retries + 1):
+            if error is not None:
+                print("Failed updating {0} on Redmine: {1}. Retrying.".format(page_title, error))
+                time.sleep(self.RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                outcome = self.__write_unless_unchanged(page_title, page_text, fingerprint)
+            except Exception as e:
+                error = e
+                continue
+            if outcome is None:
+                error = "not accepted"
+                continue
+
+            if outcome != "not written":
+                self.retry_queue.pop(page_title, None)
+            if new_watermark is not None:
+                self.watermarks[page_title] = new_watermark
+            return outcome
+
+        print("Failed updating {0} on Redmine: {1}".format(page_title, error))
+        self.retry_queue[page_title] = page_text
+        return "failed"
+
+    def __write_unless_unchanged(self, page_title, page_text, fingerprint):
+        if not self.args.always_write:
+            if page_title not in self.published_fingerprints:
+                with metrics.phase("redmine page fetch"):
+                    current_text = self.wiki.text_of(page_title)
+                if current_text is not None:
+                    self.published_fingerprints[page_title] = content_fingerprint(current_text)
+
+            if self.published_fingerprints.get(page_title) == fingerprint:
+                print("Unchanged: {0}".format(page_title))
+                return "unchanged"
+
+        if self.args.dry_run:
             print("Would update {0} on Redmine".format(page_title))
+            return "not written"
+
+        print("Updating {0} on Redmine".format(page_title))
+        with metrics.phase("redmine write"):
+            is_updated = self.wiki.create_or_update(page_title, page_text)
+        if not is_updated:
+            return None
+        print("Done updating {0} on Redmine".format(page_title))
+        self.published_fingerprints[page_title] = fingerprint
+        return "written"
+
+    def __filter_key_of(self, report_item):
+        return repr((report_item.from_time, report_item.until_time, sorted(self.emails_to_skip)))
+
+
+def report_items_to_update_of(parsed_input_page, args):
+    report_items_to_update = []
+    for report_item in parsed_input_page.report_items:
+        if report_item.should_be_updated or args.ignore_should_be_updated:
+            report_items_to_update.append(report_item)
+        else:
+            print("Skipping: {0}".format(report_item.wiki_page))
+    return report_items_to_update
+
+def run_once(wiki, input_page_name, report_updater, args):
+    print("Fetching input page from Redmine.")
+    with metrics.phase("redmine input fetch"):
+        input_page = wiki.get(input_page_name)
+
+    print("Parsing input page.")
+    with metrics.phase("input parse"):
+        parsed_input_page = ParsedInputPage(input_page.text)
+
+    print("Start updating the report of code reviews.")
+    report_updater.update(report_items_to_update_of(parsed_input_page, args))
+
+def report_metrics(args):
+    """Prints the metrics with --profile and writes them to --metrics-json
+    """
+    if args.profile:
+        print('\n'.join(metrics.summary_lines()))
+    if args.metrics_json:
+        save_json(args.metrics_json, metrics.report())
+
+def run_daemon(wiki, input_page_name, report_updater, change_cache, event_stream, args):
+    """Polls the input page every --poll-interval seconds and updates the reports that are due.
+
+    A report is due when its "Refresh" interval, or --refresh-interval, elapsed since its
+    last successful update, or when its row on the input page changed. The Redmine
+    client, the parsed input page and the parsed changes stay in memory between cycles.
+
+    With an event stream, the events are applied to the parsed changes as they arrive,
+    and the reports listing the changes they touched are updated right away, from
+    memory. The parsed changes are trusted to be up to date only while the stream is
+    alive; once it ended, they are checked with Gerrit again.
+
+    Only the parsed changes listed by the reports to update are kept, and the metrics
+    are reported and reset after each cycle that updated reports.
+    """
+    input_page_text = None
+    report_items_to_update = []
+    last_update_times = {}
+    last_report_items = {}
+    dirty_titles = set()
+    next_poll_time = 0
+
+    if event_stream is not None:
+        # The events are those of the default Gerrit host
+        event_parser = report_updater.change_parser.default_parser
+        event_ingester = EventIngester(event_parser)
+        event_parser.trust_known_changes = True
+
+    while True:
+        if event_stream is not None and event_parser.trust_known_changes and not event_stream.is_alive():
+            print("The event stream ended, checking the known changes with Gerrit again.")
+            event_parser.trust_known_changes = False
+
+        cycle_start = time.time()
+        due_report_items = []
+        try:
+            if cycle_start >= next_poll_time:
+                next_poll_time = cycle_start + args.poll_interval
+
+                with metrics.phase("redmine input fetch"):
+                    text = wiki.get(input_page_name).text
+                if text != input_page_text:
+                    print("Parsing input page.")
+                    with metrics.phase("input parse"):
+                        report_items_to_update = report_items_to_update_of(ParsedInputPage(text), args)
+                    input_page_text = text
+                    report_updater.change_parser.forget_changes_other_than(
+                        review_number for report_item in report_items_to_update for review_number in report_item.review_numbers)
+
+                for report_item in report_items_to_update:
+                    title = redmine_title_of(report_item)
+                    refresh_seconds = 60 * (report_item.refresh_minutes or args.refresh_interval)
+                    is_due = cycle_start - last_update_times.get(title, 0) >= refresh_seconds
+                    if is_due or last_report_items.get(title) != report_item.fingerprint():
+                        due_report_items.append(report_item)
+
+            due_titles = set(redmine_title_of(r) for r in due_report_items)
+            due_report_items.extend(r for r in report_items_to_update if redmine_title_of(r) in dirty_titles - due_titles)
+            dirty_titles = set()
+
+            if due_report_items:
+                print("Start updating {0} due reports.".format(len(due_report_items)))
+                up_to_date_pages = set(report_updater.update(due_report_items))
+                for report_item in due_report_items:
+                    title = redmine_title_of(report_item)
+                    if title in up_to_date_pages:
+                        last_update_times[title] = cycle_start
+                        last_report_items[title] = report_item.fingerprint()
+                    else:
+                        dirty_titles.add(title)  # retried at the next event or poll
+
+                if change_cache is not None:
+                    change_cache.evict()
+        except Exception as e:
+            print("Failed updating the reports: {0}".format(e))
+
+        if due_report_items:
+            report_metrics(args)
+            metrics.reset()
+
+        time_to_next_poll = max(0, next_poll_time - time.time())
+        if event_stream is None:
+            time.sleep(time_to_next_poll)
+            continue
+
+        titles_by_review_number = {}
+        for report_item in report_items_to_update:
+            for review_number in report_item.review_numbers:
+                titles_by_review_number.setdefault(review_number, set()).add(redmine_title_of(report_item))
+
+        events = event_stream.drain(time_to_next_poll)
+        for event in events:
+            try:
+                change_number = event_ingester.apply(event)
+            except Exception as e:
+                print("Failed applying an event: {0}".format(e))
+                continue
+            if change_number is not None:
+                dirty_titles.update(titles_by_review_number.get(change_number, ()))
+        if events:
+            print("Applied {0} events, touching {1} reports.".format(len(events), len(dirty_titles)))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-n', '--dry-run', action='store_true', help='does not write reports back to Redmine')
+    arg_parser.add_argument('-s', '--std-out', action='store_true', help='prints reports on standard output')
+    arg_parser.add_argument('-I', '--ignore-should-be-updated', action='store_true', help='ignores "Should be updated" column of input table and updates all reports. USE WITH CAUTION!')
+    arg_parser.add_argument('--gerrit-address', default=env.get('GERRIT_ADDRESS', DEFAULT_GERRIT_ADDRESS), metavar='URL', help='address of Gerrit (default: $GERRIT_ADDRESS or {0})'.format(DEFAULT_GERRIT_ADDRESS))
+    arg_parser.add_argument('--gerrit-host', action='append', metavar='HOST=URL', help='address of the Gerrit host of the review numbers written as HOST:NUMBER on the input table, https://HOST if not given. May be repeated')
+    arg_parser.add_argument('--gerrit-concurrency', type=int, default=4, metavar='N', help='maximum number of concurrent requests to each Gerrit host (default: 4)')
+    arg_parser.add_argument('--gerrit-batch-size', type=int, default=Gerrit.MAX_CHANGES_PER_QUERY, metavar='N', help='number of changes fetched by each request to Gerrit, 1 fetches them one by one (default: {0})'.format(Gerrit.MAX_CHANGES_PER_QUERY))
+    arg_parser.add_argument('--gerrit-rate', type=float, default=10, metavar='N', help='maximum number of requests per second to each Gerrit host, lowered while it throttles them, 0 for no limit (default: 10)')
+    arg_parser.add_argument('--gerrit-cache-dir', default=env.get('GERRIT_CACHE_DIR'), metavar='DIR', help='directory where fetched changes are cached between runs (default: $GERRIT_CACHE_DIR, no cache if unset)')
+    arg_parser.add_argument('--gerrit-cache-max-entries', type=int, default=5000, metavar='N', help='number of least recently used changes kept in the cache (default: 5000)')
+    arg_parser.add_argument('--gerrit-cache-max-age', type=int, default=180, metavar='DAYS', help='evicts cached changes unused for this many days (default: 180)')
+    arg_parser.add_argument('--review-store', default=env.get('GERRIT_REVIEW_STORE'), metavar='FILE', help='SQLite file where the reviews of the fetched changes are kept and queried by the reports, merged changes in it are not fetched again (default: $GERRIT_REVIEW_STORE, no store if unset)')
+    arg_parser.add_argument('--redmine-concurrency', type=int, default=4, metavar='N', help='maximum number of pages written to Redmine at once (default: 4)')
+    arg_parser.add_argument('--redmine-rate', type=float, default=5, metavar='N', help='maximum number of requests per second to Redmine, 0 for no limit (default: 5)')
+    arg_parser.add_argument('--redmine-retries', type=int, default=3, metavar='N', help='number of retries of the pages that failed to be written to Redmine, before queueing them for the next update (default: 3)')
+    arg_parser.add_argument('--state-dir', default=env.get('GERRIT_BOT_STATE_DIR'), metavar='DIR', help='directory where the state of the reports is kept between runs (default: $GERRIT_BOT_STATE_DIR)')
+    arg_parser.add_argument('-i', '--incremental', action='store_true', help='only fetches the changes updated since the last run of each report, reusing its other rows. Requires --state-dir')
+    arg_parser.add_argument('--reviewer-summary', action='store_true', help='adds a table to each report with the number of reviews of each reviewer, of each vote and project, and their median time to review')
+    arg_parser.add_argument('-W', '--always-write', action='store_true', help='writes reports to Redmine even if their content did not change')
+    arg_parser.add_argument('--profile', action='store_true', help='prints the time of each phase, the requests to each endpoint and the slowest changes at the end, or after each update in daemon mode')
+    arg_parser.add_argument('--metrics-json', metavar='FILE', help='writes the metrics printed by --profile to FILE as JSON')
+    arg_parser.add_argument('-d', '--daemon', action='store_true', help='keeps running, updating each report again when its refresh interval elapses')
+    arg_parser.add_argument('--poll-interval', type=float, default=60, metavar='SECONDS', help='how often the daemon checks the input page for reports that are due (default: 60)')
+    arg_parser.add_argument('--refresh-interval', type=float, default=60, metavar='MINUTES', help='refresh interval of the reports without one on the "Refresh" column of the input table (default: 60)')
+    arg_parser.add_argument('--events', metavar='SOURCE', help='in daemon mode, applies the JSON lines of `gerrit stream-events` read from SOURCE: a file or a pipe, - for standard input, tcp:HOST:PORT or unix:PATH')
+    arg_parser.add_argument('--http-timeout', type=float, default=30, metavar='SECONDS', help='timeout of each request to Gerrit and Redmine (default: 30)')
+    arg_parser.add_argument('--http-retries', type=int, default=3, metavar='N', help='number of retries of requests to Gerrit that failed transiently (default: 3)')
+    args = arg_parser.parse_args()
+
+    if args.incremental and not args.state_dir:
+        arg_parser.error('--incremental requires --state-dir')
+    if args.events and not args.daemon:
+        arg_parser.error('--events requires --daemon')
+
+    gerrit_host_addresses = {}
+    for gerrit_host in args.gerrit_host or []:
+        host, separator, address = gerrit_host.partition('=')
+        if not separator or not host or not address:
+            arg_parser.error('--gerrit-host expects HOST=URL, got: ' + gerrit_host)
+        gerrit_host_addresses[host] = address
+
+    redmine_address = env['REDMINE_ADDRESS']
+    redmine_key = env['REDMINE_KEY']
+    project_name = env['REDMINE_PROJECT']
+    input_page_name = env['REDMINE_INPUT_PAGE']
+    emails_to_skip = [e.strip() for e in env.get('EMAILS_TO_SKIP', '').split(',') if len(e.strip()) > 0]
+
+    # python-redmine, with the requests library, is most of the startup time, so it is only imported once the arguments are valid
+    from redmine import Redmine
+
+    redmine_rate_limiter = TokenBucket(args.redmine_rate, name='redmine rate limit wait') if args.redmine_rate > 0 else None
+    wiki = RedmineWiki(Redmine(redmine_address, key=redmine_key, requests={'verify': False, 'timeout': args.http_timeout}), project_name, redmine_rate_limiter)
+
+    change_cache = ChangeCache(args.gerrit_cache_dir, args.gerrit_cache_max_entries, args.gerrit_cache_max_age) if args.gerrit_cache_dir else None
+    review_store = ReviewStore(args.review_store) if args.review_store else None
+
+    # Each Gerrit host has its own connections, rate limit, concurrency and cache namespace
+    def gerrit_change_parser_of(host, address):
+        gerrit_rate_limiter = AdaptiveRateLimiter(args.gerrit_rate, name='gerrit rate limit wait') if args.gerrit_rate > 0 else None
+        gerrit_session = HttpSession(timeout=args.http_timeout, retries=args.http_retries, rate_limiter=gerrit_rate_limiter)
+        cache = change_cache.namespace(re.sub('[^A-Za-z0-9.-]', '_', host)) if change_cache is not None and host is not None else change_cache
+        return ChangeParser(concurrency=args.gerrit_concurrency, cache=cache, batch_size=args.gerrit_batch_size, session=gerrit_session,
+                            gerrit_address=address, keep_changes=args.daemon, review_store=review_store, host=host)
+
+    change_parser = MultiHostChangeParser(gerrit_change_parser_of(None, args.gerrit_address), gerrit_change_parser_of, gerrit_host_addresses)
+    report_updater = ReportUpdater(wiki, change_parser, emails_to_skip, args)
+
+    try:
+        if args.daemon:
+            event_stream = EventStream(args.events).start() if args.events else None
+            run_daemon(wiki, input_page_name, report_updater, change_cache, event_stream, args)
         else:
-            print("Updating {0} on Redmine".format(page_title))
-            if wiki.create_or_update(page_title, page_text):
-                print("Done updating {0} on Redmine".format(page_title))
-            else:
-                print("Failed updating {0} on Redmine".format(page_title))
-    else:
-        print("Skipping: {0}".format(report_item.wiki_page))
-
-print("Done.")
+            run_once(wiki, input_page_name, report_updater, args)
+    except KeyboardInterrupt:
+        print("Interrupted.")
+
+    for host_change_parser in change_parser.parsers():
+        host_change_parser.gerrit.session.close()
+    if review_store is not None:
+        review_store.close()
+    if change_cache is not None:
+        change_cache.evict()
+
+    if not (args.daemon and metrics.is_empty()):  # a daemon reported those of its last cycle already
+        report_metrics(args)
+    print("Done.")
+
+
+if __name__ == '__main__':
+    main()
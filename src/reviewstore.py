@@ -0,0 +1,174 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Local SQLite store of the reviews of the parsed changes
+
+from __future__ import print_function
+
+import os
+import threading
+
+from changecache import FINAL_STATUSES
+
+def debug(msg):
+    pass
+    #print(msg)
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS changes (
+    number TEXT PRIMARY KEY,
+    subject TEXT NOT NULL,
+    project TEXT NOT NULL,
+    permalink TEXT NOT NULL,
+    status TEXT,
+    updated TEXT
+);
+CREATE TABLE IF NOT EXISTS reviews (
+    change_number TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    revision_number INTEGER NOT NULL,
+    author_name TEXT NOT NULL,
+    author_email TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    vote TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    PRIMARY KEY (change_number, position)
+);
+CREATE TABLE IF NOT EXISTS revisions (
+    change_number TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    created TEXT,
+    PRIMARY KEY (change_number, number)
+);
+CREATE INDEX IF NOT EXISTS reviews_by_change_number ON reviews (change_number);
+CREATE INDEX IF NOT EXISTS reviews_by_author_email ON reviews (author_email);
+CREATE INDEX IF NOT EXISTS reviews_by_timestamp ON reviews (timestamp);
+CREATE INDEX IF NOT EXISTS changes_by_project ON changes (project);
+"""
+
+
+class StoredReview(object):
+    """A review as read back from the store, with the fields of its change and revision a report needs
+    """
+    __slots__ = ('change_number', 'subject', 'project', 'permalink', 'revision_number', 'author_name', 'vote', 'comment',
+                 'author_email', 'timestamp', 'revision_created')
+
+    def __init__(self, change_number, subject, project, permalink, revision_number, author_name, vote, comment,
+                 author_email=None, timestamp=None, revision_created=None):
+        self.change_number = change_number
+        self.subject = subject
+        self.project = project
+        self.permalink = permalink
+        self.revision_number = revision_number
+        self.author_name = author_name
+        self.vote = vote
+        self.comment = comment
+        self.author_email = author_email
+        self.timestamp = timestamp
+        self.revision_created = revision_created
+
+
+class ReviewStore:
+    """Keeps the reviews of every change ChangeParser parses in a SQLite file, indexed by
+    change number, author email, time and project, so reports are range queries.
+
+    Each change is stored as a whole under its review number, replacing its previous
+    version, with its reviews in the order they are on the Change. Review numbers are
+    those of the input page, "HOST:NUMBER" for the changes of other Gerrit hosts than
+    the default one. It is safe to use from threads.
+    """
+
+    # SQLite limits the number of parameters of a statement
+    MAX_PARAMETERS = 500
+
+    def __init__(self, path):
+        import sqlite3  # only the runs with a review store need it
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.executescript(SCHEMA)
+        self.__lock = threading.Lock()
+
+    def put_change(self, review_number, change, updated=None, status=None):
+        review_number = str(review_number)
+        reviews = []
+        revisions = []
+        for revision in change.revisions:
+            created = revision.created.strftime(TIMESTAMP_FORMAT) if revision.created is not None else None
+            revisions.append((review_number, revision.number, created))
+            for review in revision.reviews:
+                reviews.append((review_number, len(reviews), revision.number, review.author.name, review.author.email,
+                                review.timestamp.strftime(TIMESTAMP_FORMAT), review.vote(), review.message_without_vote()))
+
+        with self.__lock:
+            with self.__connection:
+                self.__connection.execute("INSERT OR REPLACE INTO changes VALUES (?, ?, ?, ?, ?, ?)",
+                                          (review_number, change.subject, change.project, change.permalink(), status, updated))
+                self.__connection.execute("DELETE FROM reviews WHERE change_number = ?", (review_number,))
+                self.__connection.executemany("INSERT INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?)", reviews)
+                self.__connection.execute("DELETE FROM revisions WHERE change_number = ?", (review_number,))
+                self.__connection.executemany("INSERT INTO revisions VALUES (?, ?, ?)", revisions)
+        debug("[Store] Stored {0} reviews of change {1}".format(len(reviews), review_number))
+
+    def stored_change_numbers(self, change_numbers):
+        return set(number for number, _ in self.__statuses_of(change_numbers))
+
+    def final_change_numbers(self, change_numbers):
+        return set(number for number, status in self.__statuses_of(change_numbers) if status in FINAL_STATUSES)
+
+    def reviews_of(self, change_numbers, from_time=None, until_time=None, email_suffix='', emails_to_skip=()):
+        """Returns the reviews of the given changes written between `from_time` and `until_time`
+        by authors whose email ends with `email_suffix`, grouped by change number, each
+        change's in order. Their times are strings of TIMESTAMP_FORMAT.
+        """
+        conditions = []
+        parameters = []
+        if from_time is not None:
+            conditions.append("reviews.timestamp >= ?")
+            parameters.append(from_time.strftime(TIMESTAMP_FORMAT))
+        if until_time is not None:
+            conditions.append("reviews.timestamp <= ?")
+            parameters.append(until_time.strftime(TIMESTAMP_FORMAT))
+        if email_suffix:
+            conditions.append("substr(reviews.author_email, -?) = ?")
+            parameters.extend([len(email_suffix), email_suffix])
+        if emails_to_skip:
+            conditions.append("reviews.author_email NOT IN ({0})".format(', '.join('?' * len(emails_to_skip))))
+            parameters.extend(emails_to_skip)
+
+        reviews_by_change_number = {}
+        for numbers in self.__chunks_of(change_numbers):
+            query = "SELECT changes.number, changes.subject, changes.project, changes.permalink, reviews.revision_number, " \
+                    "reviews.author_name, reviews.vote, reviews.comment, reviews.author_email, reviews.timestamp, revisions.created " \
+                    "FROM reviews JOIN changes ON changes.number = reviews.change_number " \
+                    "LEFT JOIN revisions ON revisions.change_number = reviews.change_number AND revisions.number = reviews.revision_number " \
+                    "WHERE " + " AND ".join(["reviews.change_number IN ({0})".format(', '.join('?' * len(numbers)))] + conditions) + \
+                    " ORDER BY reviews.change_number, reviews.position"
+            with self.__lock:
+                rows = self.__connection.execute(query, numbers + parameters).fetchall()
+            for row in rows:
+                reviews_by_change_number.setdefault(row[0], []).append(StoredReview(*row))
+        return reviews_by_change_number
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def __statuses_of(self, change_numbers):
+        statuses = []
+        for numbers in self.__chunks_of(change_numbers):
+            query = "SELECT number, status FROM changes WHERE number IN ({0})".format(', '.join('?' * len(numbers)))
+            with self.__lock:
+                statuses.extend(self.__connection.execute(query, numbers).fetchall())
+        return statuses
+
+    def __chunks_of(self, change_numbers):
+        change_numbers = [str(cn) for cn in change_numbers]
+        return [change_numbers[i:i + self.MAX_PARAMETERS] for i in range(0, len(change_numbers), self.MAX_PARAMETERS)]
@@ -0,0 +1,56 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Tests of the per-reviewer statistics
+
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from analytics import ReviewColumns, numpy_aggregations_of, numpy_or_none, python_aggregations_of, reviewer_statistics_of
+
+
+def sample_columns():
+    columns = ReviewColumns()
+    columns.append("ana@example.com", "Ana", "nova", 1, 1000.0, 400.0)
+    columns.append("bob@example.com", "Bob", "nova", -2, 1000.0, None)
+    columns.append("ana@example.com", "Ana", "neutron", 0, 2000.0, 1000.0)
+    columns.append("ana@example.com", "Ana", "nova", 2, 3000.0, 2900.0)
+    return columns
+
+
+class ReviewerStatisticsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.statistics = reviewer_statistics_of(sample_columns())
+
+    def test_reviewers_with_the_most_reviews_first(self):
+        self.assertEqual([(s.name, s.reviews) for s in self.statistics], [("Ana", 3), ("Bob", 1)])
+
+    def test_votes(self):
+        self.assertEqual(self.statistics[0].votes, [0, 0, 1, 1, 1])
+        self.assertEqual(self.statistics[1].votes, [1, 0, 0, 0, 0])
+
+    def test_median_time_to_review(self):
+        self.assertEqual(self.statistics[0].median_time_to_review, 600.0)
+        self.assertIsNone(self.statistics[1].median_time_to_review)
+
+    def test_reviews_by_project(self):
+        self.assertEqual(self.statistics[0].reviews_by_project, [("nova", 2), ("neutron", 1)])
+
+    def test_no_reviews(self):
+        self.assertEqual(reviewer_statistics_of(ReviewColumns()), [])
+
+    def test_python_aggregations(self):
+        self.assertEqual(python_aggregations_of(sample_columns())[2], [600.0, None])
+
+    @unittest.skipIf(numpy_or_none() is None, "NumPy is not installed")
+    def test_numpy_aggregations_match_python_ones(self):
+        self.assertEqual(numpy_aggregations_of(sample_columns()), python_aggregations_of(sample_columns()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Tests of reading Gerrit events and applying them to the changes kept in memory
+
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from eventstream import EventIngester, EventStream
+from gerriter import Change, ChangeParser, Revision
+
+
+def comment_added(**fields):
+    event = {"type": "comment-added", "change": {"number": 42}, "patchSet": {"number": "1", "revision": "abc"},
+             "author": {"username": "jdoe", "name": "John Doe", "email": "jdoe@example.com"},
+             "comment": "Patch Set 1: Code-Review+1", "eventCreatedOn": 1400000000}
+    event.update(fields)
+    return event
+
+
+class EventIngesterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.change_parser = ChangeParser(keep_changes=True)
+        self.change = Change(42, "I0123456789", "Subject", "project")
+        self.change.revisions.append(Revision("abc", 1))
+        self.change_parser.known_changes["42"] = (self.change, "2014-05-01 10:00:00.000000000", "NEW")
+        self.ingester = EventIngester(self.change_parser)
+
+    def test_adds_the_review_of_a_comment(self):
+        self.assertEqual(self.ingester.apply(comment_added()), "42")
+        review = self.change.revisions[0].reviews[0]
+        self.assertEqual((review.value, review.author.name), (1, "John Doe"))
+
+    def test_names_an_author_without_name_after_its_username(self):
+        self.assertEqual(self.ingester.apply(comment_added(author={"username": "jdoe", "email": "jdoe@example.com"})), "42")
+        self.assertEqual(self.change.revisions[0].reviews[0].author.name, "jdoe")
+
+    def test_ignores_the_events_without_patch_set(self):
+        event = comment_added()
+        del event["patchSet"]
+        self.assertEqual(self.ingester.apply(event), None)
+        self.assertEqual(self.change.revisions[0].reviews, [])
+
+    def test_ignores_the_comments_without_author(self):
+        event = comment_added()
+        del event["author"]
+        self.assertEqual(self.ingester.apply(event), None)
+
+    def test_ignores_the_events_without_change_number(self):
+        self.assertEqual(self.ingester.apply(comment_added(change={})), None)
+
+
+class EventStreamTest(unittest.TestCase):
+
+    def test_reads_the_events_until_the_end_of_the_source(self):
+        with tempfile.NamedTemporaryFile() as source:
+            source.write('{"type": "ref-updated"}\nnot json\n[]\n{"type": "comment-added"}\n')
+            source.flush()
+            event_stream = EventStream(source.name).start()
+            event_stream.thread.join(5)
+            self.assertFalse(event_stream.is_alive())
+            self.assertEqual([e["type"] for e in event_stream.drain(0)], ["ref-updated", "comment-added"])
+
+
+if __name__ == '__main__':
+    unittest.main()
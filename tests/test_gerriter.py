@@ -0,0 +1,140 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Tests of the Gerrit interface and of the domain model of Gerrit changes
+
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from gerriter import ChangeParser, Gerrit, MultiHostChangeParser, Review, parse_gerrit_timestamp, split_review_number
+
+
+class ParseGerritTimestampTest(unittest.TestCase):
+
+    def test_drops_the_fraction(self):
+        self.assertEqual(parse_gerrit_timestamp("2014-05-01 10:02:03.000000000"), datetime(2014, 5, 1, 10, 2, 3))
+
+
+class ReviewTest(unittest.TestCase):
+
+    def test_review_with_single_line_message(self):
+        review_with_single_line_message = Review(1, None, '\nPatch Set 9: (1 inline comment)\n', None)
+        self.assertEqual(review_with_single_line_message.vote(), '+1')
+        self.assertEqual(review_with_single_line_message.message_without_vote(), '(1 inline comment)')
+
+    def test_review_with_multi_line_message(self):
+        review_with_multi_line_message = Review(0, None, '\nPatch Set 9:\n\n(1 comment)\n', None)
+        self.assertEqual(review_with_multi_line_message.vote(), '0')
+        self.assertEqual(review_with_multi_line_message.message_without_vote(), '(1 comment)')
+
+
+class SplitReviewNumberTest(unittest.TestCase):
+
+    def test_number_of_the_default_host(self):
+        self.assertEqual(split_review_number('12345'), (None, '12345'))
+
+    def test_number_of_another_host(self):
+        self.assertEqual(split_review_number('review.example.com:12345'), ('review.example.com', '12345'))
+        self.assertEqual(split_review_number('review.example.com:8080:12345'), ('review.example.com:8080', '12345'))
+
+
+class QueryUrlsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.gerrit = Gerrit(address="https://gerrit.example.com/")
+        self.query_urls = self.gerrit._Gerrit__query_urls
+
+    def test_ors_the_change_numbers_in_one_query(self):
+        self.assertEqual(self.query_urls(['1', '2', '3'], ('MESSAGES',)),
+                         ["https://gerrit.example.com/changes/?q=change:1+OR+change:2+OR+change:3&o=MESSAGES"])
+
+    def test_ands_the_other_terms(self):
+        self.assertEqual(self.query_urls(['1', '2'], (), "+after:x"),
+                         ["https://gerrit.example.com/changes/?q=(change:1+OR+change:2)+after:x"])
+
+    def test_splits_at_the_maximum_number_of_changes_per_query(self):
+        change_numbers = [str(cn) for cn in range(2 * Gerrit.MAX_CHANGES_PER_QUERY + 1)]
+        query_urls = self.query_urls(change_numbers, ())
+        self.assertEqual([url.count("change:") for url in query_urls], [Gerrit.MAX_CHANGES_PER_QUERY, Gerrit.MAX_CHANGES_PER_QUERY, 1])
+        self.assertEqual(sum((url.partition("?q=")[2].split("+OR+") for url in query_urls), []), ["change:" + cn for cn in change_numbers])
+
+    def test_splits_the_queries_longer_than_the_maximum_url_length(self):
+        change_numbers = [str(10 ** 150 + cn) for cn in range(40)]
+        query_urls = self.query_urls(change_numbers, ())
+        self.assertTrue(len(query_urls) > 1)
+        self.assertTrue(all(len(url) <= Gerrit.MAX_QUERY_URL_LENGTH for url in query_urls))
+        self.assertEqual(sum(url.count("change:") for url in query_urls), len(change_numbers))
+
+    def test_no_query_without_change_numbers(self):
+        self.assertEqual(self.query_urls([], ()), [])
+
+
+class FailingBatchGerrit(Gerrit):
+    """Fails the queries of several changes, and the fetch of change 2 by itself
+    """
+
+    def fetch_changes(self, change_numbers):
+        raise IOError("batch failed")
+
+    def fetch_change(self, change_number):
+        if str(change_number) == '2':
+            raise IOError("change failed")
+        return {"_number": int(change_number), "change_id": "I" + str(change_number), "subject": "Subject", "project": "project",
+                "revisions": {}, "messages": []}
+
+
+class BatchFailureTest(unittest.TestCase):
+
+    def test_fetches_the_changes_of_a_failed_batch_one_by_one(self):
+        change_parser = ChangeParser(batch_size=3)
+        change_parser.gerrit = FailingBatchGerrit()
+        changes = change_parser.changes_by_number(['1', '2', '3'])
+        self.assertEqual(list(changes.keys()), ['1', '3'])
+        self.assertEqual(list(change_parser.errors.keys()), ['2'])
+
+
+class SummaryGerrit(Gerrit):
+    """Answers that no change was updated, and records the changes it is asked about
+    """
+
+    def __init__(self):
+        Gerrit.__init__(self)
+        self.checked_change_numbers = []
+
+    def fetch_change_summaries(self, change_numbers):
+        self.checked_change_numbers.extend(change_numbers)
+        return dict((change_number, {"updated": "2014-05-01 10:00:00.000000000"}) for change_number in change_numbers)
+
+
+class KnownChangesTest(unittest.TestCase):
+
+    def test_only_merged_changes_are_reused_without_checking_them(self):
+        change_parser = ChangeParser(keep_changes=True)
+        change_parser.gerrit = SummaryGerrit()
+        for change_number, status in [('1', 'MERGED'), ('2', 'ABANDONED'), ('3', 'NEW')]:
+            change_parser.known_changes[change_number] = (change_number, "2014-05-01 10:00:00.000000000", status)
+
+        self.assertEqual(list(change_parser.changes_by_number(['1', '2', '3']).values()), ['1', '2', '3'])
+        self.assertEqual(sorted(change_parser.gerrit.checked_change_numbers), ['2', '3'])
+
+
+class ForgetChangesTest(unittest.TestCase):
+
+    def test_keeps_only_the_known_changes_of_the_given_review_numbers(self):
+        default_parser = ChangeParser(keep_changes=True)
+        default_parser.known_changes.update({'1': None, '2': None})
+        change_parser = MultiHostChangeParser(default_parser, lambda host, address: ChangeParser(keep_changes=True))
+        change_parser.parser_of('other').known_changes.update({'1': None, '3': None})
+
+        change_parser.forget_changes_other_than(['2', 'other:1', 'other:4'])
+        self.assertEqual(list(default_parser.known_changes.keys()), ['2'])
+        self.assertEqual(list(change_parser.parser_of('other').known_changes.keys()), ['1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
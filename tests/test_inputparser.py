@@ -0,0 +1,199 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Tests of the parser of the input page
+
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+from datetime import datetime, date, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from inputparser import ParsedInputPage, ReviewReportItem, ReviewTable, parse_time_from, parse_time_until
+
+
+TEST_SAMPLE = \
+u"""
+h1. Code Reviews
+
+some text
+
+table{border:1px bordercolor:darkblue}.
+|_{background:#ffa}.Wiki page|_{background:#ffa}.Sprint|_{background:#ffa}.From (YYYY-MM-DD)|_{background:#ffa}.Until (YYYY-MM-DD)|_{background:#ffa}.Should be updated (yes/no)|_{background:#ffa}.Review numbers (space separated list)|
+| [[US904 - As a Dev I want to do code review on OpenStack code]] | #9 | 2014-04-28 | 2014-05-18 | YeS | 89220 90476 |
+|[[US1004 - As a Dev I want to do code review on OpenStack code]]| #10 | 2014-05-19 | 2014-06-08 | nO | |
+| [[US1104 - As a Dev I want to do code review on OpenStack code]] | #11 | | | | |
+|||||||
+| [[  ]] ||||yes||
+
+more text
+"""
+
+
+class ReviewTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.review_table = ReviewTable(TEST_SAMPLE)
+
+    def test_columns(self):
+        self.assertEqual(self.review_table.columns, ['Wiki page', 'Sprint', 'From', 'Until', 'Should be updated', 'Review numbers'])
+
+    def test_row_with_all_fields(self):
+        #| [[US904 - As a Dev I want to do code review on OpenStack code]] | #9 | 2014-04-28 | 2014-05-18 | yes | 89220 90476 |
+        self.assertEqual(self.review_table.rows[0].wiki_page, 'US904 - As a Dev I want to do code review on OpenStack code')
+        self.assertEqual(self.review_table.rows[0].sprint, '#9')
+        self.assertEqual(self.review_table.rows[0].from_date, '2014-04-28')
+        self.assertEqual(self.review_table.rows[0].until_date, '2014-05-18')
+        self.assertEqual(self.review_table.rows[0].should_be_updated, 'yes')
+        self.assertEqual(self.review_table.rows[0].review_numbers, '89220 90476')
+
+    def test_row_without_review_numbers(self):
+        #|[[US1004 - As a Dev I want to do code review on OpenStack code]]| #10 | 2014-05-19 | 2014-06-08 | no | |
+        self.assertEqual(self.review_table.rows[1].wiki_page, 'US1004 - As a Dev I want to do code review on OpenStack code')
+        self.assertEqual(self.review_table.rows[1].sprint, '#10')
+        self.assertEqual(self.review_table.rows[1].from_date, '2014-05-19')
+        self.assertEqual(self.review_table.rows[1].until_date, '2014-06-08')
+        self.assertEqual(self.review_table.rows[1].should_be_updated, 'no')
+        self.assertEqual(self.review_table.rows[1].review_numbers, '')
+
+    def test_row_without_dates(self):
+        #| [[US1104 - As a Dev I want to do code review on OpenStack code]] | #11 | | | | |
+        self.assertEqual(self.review_table.rows[2].wiki_page, 'US1104 - As a Dev I want to do code review on OpenStack code')
+        self.assertEqual(self.review_table.rows[2].sprint, '#11')
+        self.assertEqual(self.review_table.rows[2].from_date, '')
+        self.assertEqual(self.review_table.rows[2].until_date, '')
+        self.assertEqual(self.review_table.rows[2].should_be_updated, '')
+        self.assertEqual(self.review_table.rows[2].review_numbers, '')
+
+    def test_empty_row(self):
+        #|||||||
+        self.assertEqual(self.review_table.rows[3].wiki_page, '')
+        self.assertEqual(self.review_table.rows[3].sprint, '')
+        self.assertEqual(self.review_table.rows[3].from_date, '')
+        self.assertEqual(self.review_table.rows[3].until_date, '')
+        self.assertEqual(self.review_table.rows[3].should_be_updated, '')
+        self.assertEqual(self.review_table.rows[3].review_numbers, '')
+
+    def test_row_without_wiki_page(self):
+        #| [[  ]] ||||yes||
+        self.assertEqual(self.review_table.rows[4].wiki_page, '')
+        self.assertEqual(self.review_table.rows[4].sprint, '')
+        self.assertEqual(self.review_table.rows[4].from_date, '')
+        self.assertEqual(self.review_table.rows[4].until_date, '')
+        self.assertEqual(self.review_table.rows[4].should_be_updated, 'yes')
+        self.assertEqual(self.review_table.rows[4].review_numbers, '')
+
+
+class ParseTimeTest(unittest.TestCase):
+
+    def test_parse_time_from(self):
+        self.assertEqual(parse_time_from('2014-04-28'), datetime.combine(date(year=2014, month=4, day=28), time.min))
+        self.assertEqual(parse_time_from('2014-04-28'), parse_time_from('2014-04-28'))
+        self.assertLess(parse_time_from('2014-04-27'), parse_time_from('2014-04-28'))
+        self.assertGreater(parse_time_from('2014-04-29'), parse_time_from('2014-04-28'))
+
+    def test_parse_time_until(self):
+        self.assertEqual(parse_time_until('2014-04-28'), datetime.combine(date(year=2014, month=4, day=28), time.max))
+        self.assertEqual(parse_time_until('2014-04-28'), parse_time_until('2014-04-28'))
+        self.assertLess(parse_time_until('2014-04-27'), parse_time_until('2014-04-28'))
+        self.assertGreater(parse_time_until('2014-04-29'), parse_time_until('2014-04-28'))
+
+    def test_from_is_before_until(self):
+        self.assertLess(parse_time_from('2014-04-28'), parse_time_until('2014-04-28'))
+        self.assertGreater(parse_time_from('2014-04-29'), parse_time_until('2014-04-28'))
+
+
+class ReviewReportItemTest(unittest.TestCase):
+
+    def setUp(self):
+        self.report_items = [ReviewReportItem(r) for r in ReviewTable(TEST_SAMPLE).rows]
+
+    def test_item_of_row_with_all_fields(self):
+        #| [[US904 - As a Dev I want to do code review on OpenStack code]] | #9 | 2014-04-28 | 2014-05-18 | yes | 89220 90476 |
+        self.assertEqual(self.report_items[0].wiki_page, 'US904 - As a Dev I want to do code review on OpenStack code')
+        self.assertEqual(self.report_items[0].sprint, '#9')
+        self.assertEqual(self.report_items[0].from_time, parse_time_from('2014-04-28'))
+        self.assertEqual(self.report_items[0].until_time, parse_time_until('2014-05-18'))
+        self.assertTrue(self.report_items[0].should_be_updated)
+        self.assertEqual(self.report_items[0].review_numbers, ['89220', '90476'])
+
+    def test_item_of_row_without_review_numbers(self):
+        #| [[US1004 - As a Dev I want to do code review on OpenStack code]] | #10 | 2014-05-19 | 2014-06-08 | no | |
+        self.assertEqual(self.report_items[1].wiki_page, 'US1004 - As a Dev I want to do code review on OpenStack code')
+        self.assertEqual(self.report_items[1].sprint, '#10')
+        self.assertEqual(self.report_items[1].from_time, parse_time_from('2014-05-19'))
+        self.assertEqual(self.report_items[1].until_time, parse_time_until('2014-06-08'))
+        self.assertFalse(self.report_items[1].should_be_updated)
+        self.assertEqual(self.report_items[1].review_numbers, [])
+
+    def test_item_of_row_without_dates(self):
+        #| [[US1104 - As a Dev I want to do code review on OpenStack code]] | #11 | | | | |
+        self.assertEqual(self.report_items[2].wiki_page, 'US1104 - As a Dev I want to do code review on OpenStack code')
+        self.assertEqual(self.report_items[2].sprint, '#11')
+        self.assertIsNone(self.report_items[2].from_time)
+        self.assertIsNone(self.report_items[2].until_time)
+        self.assertFalse(self.report_items[2].should_be_updated)
+        self.assertEqual(self.report_items[2].review_numbers, [])
+
+    def test_item_of_empty_row(self):
+        #|||||||
+        self.assertEqual(self.report_items[3].wiki_page, '')
+        self.assertEqual(self.report_items[3].sprint, '')
+        self.assertIsNone(self.report_items[3].from_time)
+        self.assertIsNone(self.report_items[3].until_time)
+        self.assertFalse(self.report_items[3].should_be_updated)
+        self.assertEqual(self.report_items[3].review_numbers, [])
+
+    def test_item_of_row_without_wiki_page(self):
+        #| [[  ]] ||||yes||
+        self.assertEqual(self.report_items[4].wiki_page, '')
+        self.assertEqual(self.report_items[4].sprint, '')
+        self.assertIsNone(self.report_items[4].from_time)
+        self.assertIsNone(self.report_items[4].until_time)
+        self.assertFalse(self.report_items[4].should_be_updated)
+        self.assertEqual(self.report_items[4].review_numbers, [])
+        self.assertIsNone(self.report_items[4].refresh_minutes)
+
+    def test_refresh_column(self):
+        review_table_with_refresh = ReviewTable(TEST_SAMPLE.replace(u'(space separated list)|', u'(space separated list)|_{background:#ffa}.Refresh (minutes)|')
+                                                   .replace(u'| 89220 90476 |', u'| 89220 90476 | 5 |'))
+        self.assertEqual(review_table_with_refresh.columns[-1], 'Refresh')
+        self.assertEqual(ReviewReportItem(review_table_with_refresh.rows[0]).refresh_minutes, 5)
+        self.assertEqual(ReviewReportItem(review_table_with_refresh.rows[0]).review_numbers, ['89220', '90476'])
+        self.assertEqual(ReviewReportItem(review_table_with_refresh.rows[0]).fingerprint(), self.report_items[0].fingerprint())
+
+    def test_fingerprint(self):
+        self.assertNotEqual(self.report_items[0].fingerprint(), self.report_items[1].fingerprint())
+
+
+class ParsedInputPageTest(unittest.TestCase):
+
+    def test_report_items(self):
+        self.assertEqual(len(ParsedInputPage(TEST_SAMPLE).report_items), 5)
+
+    def test_tables_without_wiki_page_column_are_ignored(self):
+        self.assertEqual(len(ParsedInputPage(TEST_SAMPLE + u'\ntable{}.\n|_.Notes|\n|none|\n').report_items), 5)
+
+    def test_table_without_style_line(self):
+        text = TEST_SAMPLE.replace(u'table{border:1px bordercolor:darkblue}.\n', u'')
+        self.assertEqual([item.wiki_page for item in ParsedInputPage(text).report_items],
+                         [item.wiki_page for item in ParsedInputPage(TEST_SAMPLE).report_items])
+
+    def test_table_with_indented_style_line(self):
+        text = TEST_SAMPLE.replace(u'table{', u'  table{')
+        self.assertEqual(len(ParsedInputPage(text).report_items), 5)
+
+    def test_table_with_line_of_only_spaces(self):
+        text = u"table{}.\n|_.Wiki page|_.Sprint|_.From|_.Until|_.Should be updated|_.Review numbers|\n" \
+               u"| [[A]] | #1 | | | yes | 1 |\n   \n| [[B]] | #1 | | | yes | 2 |\n"
+        self.assertEqual([item.wiki_page for item in ParsedInputPage(text).report_items], ['A', 'B'])
+
+    def test_report_items_of_several_tables(self):
+        self.assertEqual([item.wiki_page for item in ParsedInputPage(TEST_SAMPLE + u'\r\n\r\nh2. Other team\r\n\r\n' + TEST_SAMPLE).report_items][4:6],
+                         ['', 'US904 - As a Dev I want to do code review on OpenStack code'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Tests of the streaming, field-projected decoding of JSON
+
+from __future__ import print_function
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from jsonstream import Fields, decode_projected
+
+
+class DecodeProjectedTest(unittest.TestCase):
+
+    def test_object_projection(self):
+        self.assertEqual(decode_projected(['{"a": 1, "b": [1, 2], "c": {"d": 2, "e": 3}}'], {"a": True, "c": Fields(["d"])}),
+                         {"a": 1, "c": {"d": 2}})
+
+    def test_values_split_between_chunks(self):
+        self.assertEqual(decode_projected([")]}'\n[", '{"n": 12', '34, "x": "y"}', ', {"n": 5}]'], [{"n": True}], ")]}'\n"),
+                         [{"n": 1234}, {"n": 5}])
+        self.assertEqual(decode_projected(['[1.', '5]'], [True]), [1.5])
+        self.assertEqual(decode_projected(['[1e', '3, 2]'], [True]), [1000.0, 2])
+        self.assertEqual(decode_projected(['{"a": 1.', '5, "b": 2}'], {"a": True}), {"a": 1.5})
+
+    def test_wildcard_projection(self):
+        self.assertEqual(decode_projected(['{"r": {"abc": {"_n": 1, "f": 2}}, "s": null}'], {"r": {"*": Fields(["_n"])}, "s": {"*": True}}),
+                         {"r": {"abc": {"_n": 1}}, "s": None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Tests of the metrics of a run
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from metrics import Metrics, TimedIterator
+
+
+def slow_chunks():
+    for chunk in ['a', 'b']:
+        time.sleep(0.01)
+        yield chunk
+
+
+class TimedIteratorTest(unittest.TestCase):
+
+    def test_adds_up_the_time_waiting_for_the_items(self):
+        chunks = TimedIterator(slow_chunks())
+        self.assertEqual(''.join(chunks), 'ab')
+        self.assertTrue(chunks.seconds >= 0.02)
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_phases_add_up(self):
+        metrics = Metrics()
+        metrics.record_phase("read", 1)
+        metrics.record_phase("read", 2)
+        self.assertEqual(metrics.report()["phases"], {"read": 3})
+
+    def test_reset(self):
+        metrics = Metrics()
+        metrics.record_phase("read", 1)
+        metrics.record_request("gerrit query", 0.5, 100)
+        metrics.reset()
+        self.assertTrue(metrics.is_empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
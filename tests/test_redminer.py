@@ -0,0 +1,187 @@
+# Copyright 2014 Gabriel Assis Bezerra
+#
+# Tests of the incremental updates of the reports, against fakes of Gerrit and Redmine
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from gerriter import Author, Change, Review, Revision
+from inputparser import ParsedInputPage
+from metrics import metrics
+from redminer import RenderedRowCache, ReportPage, ReportUpdater
+
+INPUT_PAGE_HEADER = u"table{border:1px bordercolor:darkblue}.\n" \
+                    u"|_.Wiki page|_.Sprint|_.From (YYYY-MM-DD)|_.Until (YYYY-MM-DD)|_.Should be updated (yes/no)|_.Review numbers (space separated list)|\n"
+
+# After the watermarks of the reports, whatever the time the tests run at
+UPDATED_AFTER_WATERMARKS = "2099-01-01 00:00:00.000000000"
+
+
+def report_items_of(*rows):
+    return ParsedInputPage(INPUT_PAGE_HEADER + u'\n'.join(rows) + u'\n').report_items
+
+
+def change_with_number(change_number):
+    change = Change(int(change_number), "I" + change_number * 9, "Change " + change_number, "project")
+    revision = Revision("r" + change_number, 1)
+    author = Author("jdoe", "John Doe", "jdoe@lsd.ufcg.edu.br")
+    revision.reviews.append(Review(1, author, "Patch Set 1: Code-Review+1\n\nReview of " + change_number, datetime(2014, 5, 2)))
+    change.revisions.append(revision)
+    return change
+
+
+class FakeChangeParser:
+    """Serves the changes of any number, recording those fetched, and tells the `updated` ones as updated
+    """
+    concurrency = 1
+    batch_size = 1
+    review_store = None
+
+    def __init__(self, updated=()):
+        self.updated = set(updated)
+        self.fetched = set()
+        self.errors = {}
+
+    def changes_by_number(self, review_numbers):
+        self.fetched.update(review_numbers)
+        return dict((review_number, change_with_number(review_number)) for review_number in review_numbers)
+
+    def changes_updated_since(self, review_numbers, since):
+        return dict((review_number, UPDATED_AFTER_WATERMARKS) for review_number in review_numbers if review_number in self.updated)
+
+
+class FakeWiki:
+    """Keeps the pages in memory, failing to write those in `failing`
+    """
+
+    def __init__(self):
+        self.pages = {}
+        self.written = []
+        self.failing = set()
+
+    def text_of(self, title):
+        return self.pages.get(title)
+
+    def create_or_update(self, title, wiki_text):
+        if title in self.failing:
+            return False
+        self.pages[title] = wiki_text
+        self.written.append(title)
+        return True
+
+
+class IncrementalUpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.wiki = FakeWiki()
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+    def update(self, report_items, updated=(), emails_to_skip=[]):
+        """Runs an incremental update, as a new run would, and returns the numbers of the changes it fetched
+        """
+        args = argparse.Namespace(incremental=True, state_dir=self.state_dir, reviewer_summary=False, always_write=False, dry_run=False,
+                                  std_out=False, redmine_concurrency=1, redmine_retries=0)
+        change_parser = FakeChangeParser(updated)
+        stdout, sys.stdout = sys.stdout, StringIO()  # the progress of the update
+        try:
+            self.up_to_date_pages = ReportUpdater(self.wiki, change_parser, emails_to_skip, args).update(report_items)
+        finally:
+            sys.stdout = stdout
+        return change_parser.fetched
+
+    def test_first_update_fetches_all_changes(self):
+        self.assertEqual(self.update(report_items_of(u"| [[Report A]] | #1 | | | yes | 1 2 |")), set(['1', '2']))
+        self.assertEqual(self.wiki.written, ['Report A'])
+
+    def test_unchanged_reports_are_not_rebuilt(self):
+        report_items = report_items_of(u"| [[Report A]] | #1 | | | yes | 1 2 |")
+        self.update(report_items)
+        self.assertEqual(self.update(report_items), set())
+        self.assertEqual(self.wiki.written, ['Report A'])
+        self.assertEqual(self.up_to_date_pages, ['Report A'])
+
+    def test_only_updated_changes_are_fetched_again(self):
+        report_items = report_items_of(u"| [[Report A]] | #1 | | | yes | 1 2 |")
+        self.update(report_items)
+        text = self.wiki.pages['Report A']
+        self.assertEqual(self.update(report_items, updated=['2']), set(['2']))
+        self.assertIn("Review of 1", self.wiki.pages['Report A'])
+        self.assertEqual(self.wiki.pages['Report A'].split("Last updated")[0], text.split("Last updated")[0])
+
+    def test_changes_added_to_a_row_are_fetched(self):
+        self.update(report_items_of(u"| [[Report A]] | #1 | | | yes | 1 2 |"))
+        self.assertEqual(self.update(report_items_of(u"| [[Report A]] | #1 | | | yes | 1 2 3 |")), set(['3']))
+        self.assertIn("Review of 3", self.wiki.pages['Report A'])
+
+    def test_filter_change_rebuilds_the_report_in_full(self):
+        self.update(report_items_of(u"| [[Report A]] | #1 | | | yes | 1 2 |"))
+        self.assertEqual(self.update(report_items_of(u"| [[Report A]] | #1 | 2014-05-01 | 2014-05-31 | yes | 1 2 |")), set(['1', '2']))
+
+    def test_skipped_emails_change_rebuilds_the_report_in_full(self):
+        report_items = report_items_of(u"| [[Report A]] | #1 | | | yes | 1 2 |")
+        self.update(report_items)
+        self.assertEqual(self.update(report_items, emails_to_skip=["jdoe@lsd.ufcg.edu.br"]), set(['1', '2']))
+        self.assertNotIn("Review of", self.wiki.pages['Report A'])
+
+    def test_report_in_the_retry_queue_is_rebuilt_and_written(self):
+        report_items = report_items_of(u"| [[Report A]] | #1 | | | yes | 1 |", u"| [[Report B]] | #1 | | | yes | 2 |")
+        self.wiki.failing.add('Report B')
+        self.update(report_items)
+        self.assertEqual(self.wiki.written, ['Report A'])
+        self.assertNotIn('Report B', self.up_to_date_pages)
+
+        self.wiki.failing = set()
+        self.assertEqual(self.update(report_items), set(['2']))
+        self.assertEqual(self.wiki.written, ['Report A', 'Report B'])
+        self.assertEqual(sorted(self.up_to_date_pages), ['Report A', 'Report B'])
+
+
+    def test_report_in_the_retry_queue_is_rebuilt_from_its_watermark(self):
+        report_items = report_items_of(u"| [[Report A]] | #1 | | | yes | 1 2 |")
+        self.update(report_items)
+        text = self.wiki.pages['Report A']
+        with open(os.path.join(self.state_dir, 'redmine-retry-queue.json'), 'w') as f:
+            json.dump({'Report A': 'text that failed to be written'}, f)
+
+        self.assertEqual(self.update(report_items), set())
+        self.assertEqual(self.wiki.pages['Report A'], text)
+        with open(os.path.join(self.state_dir, 'redmine-retry-queue.json')) as f:
+            self.assertEqual(json.load(f), {})
+
+    def test_page_fetch_is_timed_apart_from_the_write(self):
+        self.wiki.pages['Report A'] = u"text written before"
+        metrics.reset()
+        self.update(report_items_of(u"| [[Report A]] | #1 | | | yes | 1 |"))
+        self.assertTrue(set(["redmine page fetch", "redmine write"]) <= set(metrics.report()["phases"]))
+        metrics.reset()
+
+
+class RenderedRowCacheTest(unittest.TestCase):
+
+    def test_rows_of_a_renamed_author_are_rendered_again(self):
+        report_item = report_items_of(u"| [[Report A]] | #1 | | | yes | 1 |")[0]
+        row_cache = RenderedRowCache()
+        change = change_with_number('1')
+        ReportPage(report_item, {'1': change}, time.gmtime(), row_cache=row_cache).wiki_text()
+
+        change.revisions[0].reviews[0].author = Author("jdoe", "Jane Doe", "jdoe@lsd.ufcg.edu.br")
+        self.assertIn("Jane", ReportPage(report_item, {'1': change}, time.gmtime(), row_cache=row_cache).wiki_text())
+
+
+if __name__ == '__main__':
+    unittest.main()